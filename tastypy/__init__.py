@@ -10,9 +10,17 @@ from .file_utils import ls, normalize_path
 # Make the interesting classes available as direct import from the module
 from .persistent_ordered_dict import (
 	PersistentOrderedDict, DEFAULT_FILE_SIZE, DEFAULT_SYNC_AT, POD,
+	DEFAULT_CHECKPOINT_AT, JOURNAL_FNAME, DEFAULT_MAX_PENDING_SYNCS,
+	MANIFEST_FNAME, COMPACTION_PLAN_FNAME, convert, reshard,
 )
 
-from .json_serializer import JSONSerializer
+from .json_serializer import JSONSerializer, FastJSONSerializer
+from .binary_serializer import BinarySerializer
+from .storage import SQLiteStorage, SQLITE_FNAME
+from .mapped_pod import MappedPersistentOrderedDict, MappedPOD, INDEX_FNAME
+from .partitioned_pod import (
+	PartitionedPersistentOrderedDict, PartitionedPOD, PARTITION_FNAME
+)
 
 # import of progress_tracker must come after persistent_ordered_dict, because
 # progress_tracker module initialization requires persisitent_ordered_dict
@@ -0,0 +1,101 @@
+"""
+The background writer carries out batches of file writes on a dedicated
+thread, so that a ``POD`` opened with ``background_sync=True`` doesn't block
+its caller while synchronization files are compressed and written.
+"""
+
+import os
+import Queue
+import threading
+
+
+def write_files(writes):
+	"""
+	Carry out a batch of writes.  Each write is an ``(opener, path, mode,
+	data)`` tuple.  A write whose ``data`` is ``None`` removes ``path``
+	instead, or, if it has an ``opener``, calls ``opener(path, mode)`` (this is
+	used to rename files).
+	If ``data`` is callable, it is called to produce the data just before
+	writing, which lets it depend on the writes before it.  Missing
+	directories are created.
+	"""
+	for opener, path, mode, data in writes:
+
+		# Handle removals and renames
+		if data is None:
+			if opener is not None:
+				opener(path, mode)
+			elif os.path.exists(path):
+				os.remove(path)
+			continue
+
+		if callable(data):
+			data = data()
+
+		directory = os.path.dirname(path)
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+
+		f = opener(path, mode)
+		try:
+			f.write(data)
+		finally:
+			f.close()
+
+
+class BackgroundWriter(object):
+	"""
+	Executes batches of writes, in the order they were submitted, on a daemon
+	thread.  At most ``max_pending`` batches can be waiting to be written;
+	submitting more blocks the caller until the writer catches up.
+	"""
+
+	def __init__(self, max_pending):
+		self._queue = Queue.Queue(maxsize=max_pending)
+		self._error = None
+		self._thread = threading.Thread(target=self._run)
+		self._thread.daemon = True
+		self._thread.start()
+
+
+	def submit(self, writes):
+		"""
+		Queue a batch of writes, blocking if ``max_pending`` batches are
+		already waiting.  Raises the error from any earlier failed batch.
+		"""
+		self._raise_error()
+		self._queue.put(writes)
+
+
+	def wait(self):
+		"""
+		Block until all submitted batches have been written.  Raises the error
+		from any failed batch.
+		"""
+		self._queue.join()
+		self._raise_error()
+
+
+	def pending(self):
+		"""
+		Return the number of batches submitted but not yet written.
+		"""
+		return self._queue.unfinished_tasks
+
+
+	def _raise_error(self):
+		# Errors on the writer thread are re-raised in the caller's thread
+		error, self._error = self._error, None
+		if error is not None:
+			raise error
+
+
+	def _run(self):
+		while True:
+			writes = self._queue.get()
+			try:
+				write_files(writes)
+			except Exception as error:
+				self._error = error
+			finally:
+				self._queue.task_done()
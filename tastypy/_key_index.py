@@ -0,0 +1,137 @@
+"""
+``KeyIndex`` maps each key of a ``POD`` opened with ``compact_keys=True`` to
+its position in the ``POD``'s list of keys, without holding any objects of
+its own for each key.
+"""
+
+from array import array
+
+# Slots hold a position, or one of these markers
+_EMPTY = -1
+_REMOVED = -2
+
+_MIN_SLOTS = 8
+_HASH_MASK = (1 << 64) - 1
+_MAX_INT = (1 << 31) - 1
+
+
+class KeyIndex(object):
+	"""
+	A mapping from keys to their positions in the list ``keys``, which must
+	hold each key at its position before the key is added.  Positions are
+	kept in an open-addressing hash table held in an array of machine
+	integers, and keys are compared against the keys found at those positions
+	in ``keys``, so each key costs a few bytes rather than a dict entry and an
+	int object.  Lookups are slower than in a dict, because they are probed in
+	Python.  It provides the parts of the dict interface that ``POD``\ s use.
+	"""
+
+	def __init__(self, keys):
+		self._keys = keys
+		self.clear()
+
+
+	def clear(self):
+		self._typecode = 'i'
+		self._slots = array(self._typecode, [_EMPTY]) * _MIN_SLOTS
+		self._len = 0
+		self._used = 0
+
+
+	def _find(self, key):
+		# Get the slot holding ``key``, or, if it is absent, ``-1 - slot`` for
+		# the slot where it would go.  Slots are probed in the same sequence
+		# as in CPython's dicts.
+		slots = self._slots
+		keys = self._keys
+		mask = len(slots) - 1
+		perturb = hash(key) & _HASH_MASK
+		slot = perturb & mask
+		free = None
+		while True:
+			position = slots[slot]
+			if position == _EMPTY:
+				return -1 - (slot if free is None else free)
+			if position == _REMOVED:
+				if free is None:
+					free = slot
+			elif keys[position] == key:
+				return slot
+			perturb >>= 5
+			slot = (5 * slot + 1 + perturb) & mask
+
+
+	def _resize(self):
+		# Rebuild the table, so that it is at most a third full.  Removed
+		# slots are dropped, and positions are widened if they no longer fit.
+		if self._typecode == 'i' and len(self._keys) > _MAX_INT:
+			self._typecode = 'l'
+		num_slots = _MIN_SLOTS
+		while num_slots <= 3 * self._len:
+			num_slots <<= 1
+
+		old_slots = self._slots
+		slots = self._slots = array(self._typecode, [_EMPTY]) * num_slots
+		keys = self._keys
+		mask = num_slots - 1
+		for position in old_slots:
+			if position < 0:
+				continue
+			perturb = hash(keys[position]) & _HASH_MASK
+			slot = perturb & mask
+			while slots[slot] != _EMPTY:
+				perturb >>= 5
+				slot = (5 * slot + 1 + perturb) & mask
+			slots[slot] = position
+		self._used = self._len
+
+
+	def __getitem__(self, key):
+		slot = self._find(key)
+		if slot < 0:
+			raise KeyError(key)
+		return self._slots[slot]
+
+
+	def get(self, key, default=None):
+		slot = self._find(key)
+		if slot < 0:
+			return default
+		return self._slots[slot]
+
+
+	def __contains__(self, key):
+		return self._find(key) >= 0
+
+
+	def __len__(self):
+		return self._len
+
+
+	def __setitem__(self, key, position):
+		if position > _MAX_INT and self._typecode == 'i':
+			self._resize()
+		slot = self._find(key)
+		if slot >= 0:
+			self._slots[slot] = position
+			return
+
+		slot = -1 - slot
+		if self._slots[slot] == _EMPTY:
+			self._used += 1
+		self._slots[slot] = position
+		self._len += 1
+		if 3 * self._used >= 2 * len(self._slots):
+			self._resize()
+
+
+	def pop(self, key, *default):
+		slot = self._find(key)
+		if slot < 0:
+			if default:
+				return default[0]
+			raise KeyError(key)
+		position = self._slots[slot]
+		self._slots[slot] = _REMOVED
+		self._len -= 1
+		return position
@@ -0,0 +1,136 @@
+"""
+``LazyValues`` holds the values of a ``POD`` opened with ``lazy=True``.  Only
+the values of files that have been accessed are held in memory.
+``RawValues`` holds the values of a ``POD`` opened with ``lazy_decode=True``,
+which are only decoded once they are accessed.
+"""
+
+from collections import OrderedDict
+
+
+class LazyValues(dict):
+	"""
+	A dict of values in which looking up a key that isn't held in memory
+	calls ``load_file(key)``, which should load the values from the file that
+	holds ``key``.  ``index_of(key)`` gives the index of ``key``, and
+	``locate(key)`` gives the number of the file holding ``key`` along with
+	the range of indices that the file holds.
+
+	The numbers of loaded files are kept in ``loaded``, ordered from least to
+	most recently used if ``track_recency`` is ``True``.  Lookups are counted
+	by file: a lookup that loads a file counts as a miss, and a lookup in
+	another file that is already loaded counts as a hit.  Further lookups in
+	the same file (such as those of the values that a miss just loaded) don't
+	count again.  Lookups of values held for files that aren't loaded (such
+	as values that were set but not yet written) count as neither.
+	"""
+
+	def __init__(self, load_file, index_of, locate, track_recency=False):
+		super(LazyValues, self).__init__()
+		self._load_file = load_file
+		self._index_of = index_of
+		self._locate = locate
+		self._track_recency = track_recency
+		self.loaded = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.end_run()
+
+
+	def __getitem__(self, key):
+		if not dict.__contains__(self, key):
+			return self.__missing__(key)
+
+		# Only a lookup in another file than the last needs to be counted
+		if not self._run_start <= self._index_of(key) < self._run_stop:
+			self._start_run(key)
+			if self._run_file in self.loaded:
+				self.hits += 1
+				if self._track_recency:
+					self.loaded[self._run_file] = self.loaded.pop(
+						self._run_file)
+
+		return dict.__getitem__(self, key)
+
+
+	def __missing__(self, key):
+		self._load_file(key)
+		if dict.__contains__(self, key):
+			self.misses += 1
+			self._start_run(key)
+			return dict.__getitem__(self, key)
+		raise KeyError(key)
+
+
+	def _start_run(self, key):
+		# Note that lookups are now in the file holding ``key``
+		self._run_file, self._run_start, self._run_stop = self._locate(key)
+
+
+	def end_run(self):
+		"""
+		Forget the file of the last lookup, so that the next lookup is counted.
+		This is needed whenever the range of keys held by files changes.
+		"""
+		self._run_file, self._run_start, self._run_stop = None, 0, 0
+
+
+	def evict(self, file_num, keys):
+		"""
+		Drop the values for ``keys``, which are those held in ``file_num``.
+		"""
+		for key in keys:
+			self.pop(key, None)
+		del self.loaded[file_num]
+		self.evictions += 1
+		if file_num == self._run_file:
+			self.end_run()
+
+
+	def merge_files(self, first, stop, keys, num_removed):
+		"""
+		Drop the values for ``keys``, which are those held in files ``first``
+		up to ``stop``, as those files are being merged.  Files after them are
+		renumbered, since ``num_removed`` files are being removed.
+		"""
+		for key in keys:
+			self.pop(key, None)
+		loaded = [
+			(file_num - num_removed if file_num >= stop else file_num, flag)
+			for file_num, flag in self.loaded.iteritems()
+			if not first <= file_num < stop
+		]
+		self.loaded.clear()
+		self.loaded.update(loaded)
+		self.end_run()
+
+
+	def clear(self):
+		super(LazyValues, self).clear()
+		self.loaded.clear()
+		self.end_run()
+
+
+class RawValues(dict):
+	"""
+	A dict of values for a ``POD`` opened with ``lazy_decode=True``.  Values
+	are decoded from the serialized records in ``records`` the first time
+	they are looked up, using ``decode(record)``.  Records of decoded values
+	are dropped from ``records`` unless ``keep_records`` is ``True``.
+	"""
+
+	def __init__(self, records, decode, keep_records=False):
+		super(RawValues, self).__init__()
+		self._records = records
+		self._decode = decode
+		self._keep_records = keep_records
+
+
+	def __missing__(self, key):
+		if self._keep_records:
+			record = self._records[key]
+		else:
+			record = self._records.pop(key)
+		value = self[key] = self._decode(record)
+		return value
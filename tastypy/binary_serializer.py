@@ -0,0 +1,142 @@
+"""
+The ``BinarySerializer`` writes files of length-prefixed records, which are
+smaller and faster to read than the line-based JSON format, but aren't meant
+to be read by people.
+"""
+
+import json
+from tastypy.json_serializer import JSONSerializer, tuplify_lists
+
+
+def _pack_length(length):
+	# Encode a length as a varint: seven bits per byte, least significant
+	# first, with the high bit set on all but the last byte.
+	if length < 0x80:
+		return chr(length)
+	encoded = []
+	while length >= 0x80:
+		encoded.append(chr(length & 0x7f | 0x80))
+		length >>= 7
+	encoded.append(chr(length))
+	return ''.join(encoded)
+
+
+def _unpack_length(data, offset):
+	# Decode the varint at ``offset``, returning it and the offset after it
+	byte = ord(data[offset])
+	if byte < 0x80:
+		return byte, offset + 1
+	length, shift = byte & 0x7f, 7
+	while True:
+		offset += 1
+		byte = ord(data[offset])
+		length |= (byte & 0x7f) << shift
+		if byte < 0x80:
+			return length, offset + 1
+		shift += 7
+
+
+class BinarySerializer(JSONSerializer):
+	"""
+	Writes each key-value pair as a record holding the lengths of the
+	serialized key and value, followed by the key and value.  Files begin with
+	a header identifying the format.  String keys are stored as UTF-8, other
+	keys and all values are stored as compact JSON.  Subclasses can override
+	``serialize_value()`` and ``deserialize_value()`` to encode values
+	differently.
+	"""
+
+	name = 'binary'
+	format = 'binary-1'
+	extension = 'bin'
+	header = '\x00tastypy-binary-1\n'
+	_encoder = json.JSONEncoder(separators=(',', ':'))
+
+	@classmethod
+	def read_records(cls, f, keys_only=False, complete_only=False):
+		# Yield entries deserialized from a file, along with their records.
+		# If keys_only is True, values aren't deserialized, and None is
+		# yielded in their place.  If complete_only is True, a truncated last
+		# record is ignored.
+		data = f.read()
+		offset = 0
+		while offset < len(data):
+
+			# Find the bounds of the next record.  The low bit of the key's
+			# length says whether the key is JSON.
+			record_offset = offset
+			try:
+				key_length, offset = _unpack_length(data, offset)
+				value_length, offset = _unpack_length(data, offset)
+				value_start = offset + (key_length >> 1)
+				stop = value_start + value_length
+			except IndexError:
+				stop = None
+			if stop is None or stop > len(data):
+				if complete_only:
+					return
+				raise ValueError('Truncated record at byte %d.' % record_offset)
+
+			key = data[offset:value_start]
+			if key_length & 1:
+				key = cls.deserialize_key(key)
+			else:
+				key = key.decode('utf8')
+
+			if keys_only:
+				value = None
+			else:
+				value = cls.deserialize_value(data[value_start:stop])
+
+			offset = stop
+			yield key, value, data[record_offset:stop]
+
+
+	@classmethod
+	def value_from_record(cls, record):
+		key_length, offset = _unpack_length(record, 0)
+		value_length, offset = _unpack_length(record, offset)
+		start = offset + (key_length >> 1)
+		return cls.deserialize_value(record[start:start+value_length])
+
+
+	@classmethod
+	def key_from_record(cls, record):
+		key_length, offset = _unpack_length(record, 0)
+		value_length, offset = _unpack_length(record, offset)
+		key = record[offset:offset + (key_length >> 1)]
+		if key_length & 1:
+			return cls.deserialize_key(key)
+		return key.decode('utf8')
+
+
+	@classmethod
+	def dump_items(cls, items):
+		for key, value in items:
+			if isinstance(key, basestring):
+				serialized_key, key_is_json = key.encode('utf8'), 0
+			else:
+				serialized_key, key_is_json = cls.serialize_key(key), 1
+			serialized_value = cls.serialize_value(value)
+			yield ''.join((
+				_pack_length(len(serialized_key) << 1 | key_is_json),
+				_pack_length(len(serialized_value)),
+				serialized_key, serialized_value
+			))
+
+
+	# Keys don't need escaping, because they are delimited by their length
+	@classmethod
+	def serialize_key(cls, key):
+		return cls._json.dumps(
+			JSONSerializer.serialize_key(key, recursed=True))
+
+
+	@classmethod
+	def deserialize_key(cls, serialized_key):
+		return tuplify_lists(cls._json.loads(serialized_key))
+
+
+	@classmethod
+	def serialize_value(cls, value):
+		return cls._encoder.encode(value)
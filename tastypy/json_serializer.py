@@ -1,5 +1,17 @@
 import json
-import re
+
+# The fastest available JSON implementation, for ``FastJSONSerializer``.
+# Versions of ``ujson`` before 2.0 don't round-trip floats exactly, so they
+# aren't used.
+try:
+	import ujson as _fast_json
+	if int(_fast_json.__version__.split('.')[0]) < 2:
+		raise ImportError('ujson < 2.0 loses float precision')
+except (ImportError, AttributeError, ValueError):
+	try:
+		import simplejson as _fast_json
+	except ImportError:
+		_fast_json = json
 
 
 def tuplify_lists(obj):
@@ -15,38 +27,79 @@ class JSONSerializer(object):
 	"""
 	Uses the builtin `json` package to create and read textual entries in the
 	file format used by PersistentOrderedDict and its derivatives.
+
+	Serializers are passed to ``POD``\ s as classes.  A serializer provides
+	``dump_items(items)``, which yields the serialized record of each
+	key-value pair, and ``read_records(f, keys_only, complete_only)``, which
+	yields the key, value, and record of each entry read from an open file.
+	``read_items()`` yields just the keys and values, and
+	``key_from_record(record)`` and ``value_from_record(record)`` decode the
+	key and value in a single record.  Files are named using its
+	``extension``, and begin with its ``header``.  Its ``name`` is recorded in
+	the manifest of the files it writes, along with its ``format``.  Files can
+	be read by any serializer that has the same ``format``.
 	"""
 
-	_ESCAPE_TAB_PATTERN = re.compile('\t')
-	_UNESCAPE_TAB_PATTERN = re.compile(r'(?P<prefix>^|[^\\])\\t')
-	_ESCAPE_SLASH_PATTERN = re.compile(r'\\')
-	_UNESCAPE_SLASH_PATTERN = re.compile(r'\\\\')
+	name = 'json'
+	format = 'json-lines'
+	extension = 'json'
+	header = ''
+	_json = json
+
+	@classmethod
+	def read_items(cls, f, keys_only=False, complete_only=False):
+		for key, value, record in cls.read_records(f, keys_only, complete_only):
+			yield key, value
+
 
 	@classmethod
-	def read_items(cls, lines):
-		# Yield entries deserialized from a file.
+	def read_records(cls, lines, keys_only=False, complete_only=False):
+		# Yield entries deserialized from a file, along with the lines they
+		# were read from.  If keys_only is True, values aren't deserialized,
+		# and None is yielded in their place.  If complete_only is True, a
+		# truncated last line is ignored.
+		loads = cls._json.loads
 		for line in lines:
 
 			# skip blank lines
 			if line=='':
 				continue
 
+			if complete_only and not line.endswith('\n'):
+				continue
+
 			# Deserialize one key-value pair per line
 			serialized_key, serialized_value = line[:-1].split('\t', 1)
 			key = cls.deserialize_key(serialized_key)
-			value = cls.deserialize_value(serialized_value)
+			if keys_only:
+				value = None
+			else:
+				value = loads(serialized_value)
+
+			yield key, value, line
 
-			yield key, value
+
+	@classmethod
+	def value_from_record(cls, record):
+		return cls.deserialize_value(record[:-1].split('\t', 1)[1])
+
+
+	@classmethod
+	def key_from_record(cls, record):
+		return cls.deserialize_key(record.split('\t', 1)[0])
 
 
 	@classmethod
 	def dump_items(cls, items):
+		dumps = cls._json.dumps
 		for key, value in items:
 			serialized_key = cls.serialize_key(key)
-			serialized_value = cls.serialize_value(value)
+			serialized_value = dumps(value)
 			yield '%s\t%s\n' % (serialized_key, serialized_value)
 
 
+	# Serialized keys have their backslashes escaped.  JSON never contains
+	# literal tabs, so nothing else needs escaping.
 	@classmethod
 	def serialize_key(cls, key, recursed=False):
 
@@ -54,7 +107,7 @@ class JSONSerializer(object):
 		if isinstance(key, tuple):
 			temp_key = []
 			for item in key:
-				temp_key.append(serialize_key(item, recursed=True))
+				temp_key.append(cls.serialize_key(item, recursed=True))
 			key = tuple(temp_key)
 
 		# Base call for recursion
@@ -63,28 +116,35 @@ class JSONSerializer(object):
 
 		# Do the actual serialization in the root call
 		if not recursed:
-			key = json.dumps(key)
-			key = cls._ESCAPE_SLASH_PATTERN.sub(r'\\\\', key)
-			key = cls._ESCAPE_TAB_PATTERN.sub(r'\\t', key)
+			key = cls._json.dumps(key).replace('\\', '\\\\')
 
 		return key
 
 
 	@classmethod
 	def deserialize_key(cls, serialized_key):
-		key = cls._UNESCAPE_TAB_PATTERN.sub('\g<prefix>\t', serialized_key)
-		key = cls._UNESCAPE_SLASH_PATTERN.sub(r'\\', key)
-		key = json.loads(key)
+		key = cls._json.loads(serialized_key.replace('\\\\', '\\'))
 		key = tuplify_lists(key)
 		return key
 
 
 	@classmethod
 	def serialize_value(cls, value):
-		return json.dumps(value)
+		return cls._json.dumps(value)
 
 
 	@classmethod
 	def deserialize_value(cls, serialized_value):
-		return json.loads(serialized_value)
+		return cls._json.loads(serialized_value)
+
+
+
+class FastJSONSerializer(JSONSerializer):
+	"""
+	Writes and reads the same files as ``JSONSerializer``, but uses ``ujson``
+	or ``simplejson`` if one of them is installed, falling back to the builtin
+	``json`` package otherwise.
+	"""
 
+	name = 'fast-json'
+	_json = _fast_json
@@ -0,0 +1,311 @@
+"""
+The mapped persistent ordered dict gives read-only access to the data written
+by a ``PersistentOrderedDict`` without loading it into memory.  Files are
+memory-mapped, and a sidecar index locates the record of each key, so that
+many processes reading the same data share it through the page cache.
+"""
+
+import tastypy
+from tastypy.persistent_ordered_dict import (
+    PersistentOrderedDict, MANIFEST_FNAME, JOURNAL_FNAME, _file_path,
+    _load_manifest, _read_entries
+)
+from tastypy.json_serializer import JSONSerializer
+from collections import OrderedDict
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+
+INDEX_FNAME = 'index.bin'
+DEFAULT_MAX_MAPPED_FILES = 1024
+
+# The index holds a header, the fingerprint of the manifest it was built from,
+# and the number of entries, followed by the entries sorted by the hash of
+# their keys.  Each entry holds a key's hash, the number of the file holding
+# the key, and the offset and length of its record in that file.
+_INDEX_HEADER = 'tastypy-index-1\n'
+_FINGERPRINT_LENGTH = 41
+_UINT64 = struct.Struct('<Q')
+_INDEX_ENTRY = struct.Struct('<QIII')
+_ENTRIES_START = len(_INDEX_HEADER) + _FINGERPRINT_LENGTH + _UINT64.size
+
+
+def _key_hash(serialized_key):
+    # Hash a serialized key to 64 bits
+    return _UINT64.unpack_from(hashlib.md5(serialized_key).digest())[0]
+
+
+class MappedPersistentOrderedDict(object):
+    """
+    A read-only mapping of the data that a ``POD`` has written to ``path``,
+    which doesn't load the data into memory.  Files are memory-mapped, and
+    values are decoded each time they are looked up.  Keys are located using
+    an index kept beside the files, which is built the first time the data is
+    opened this way, and rebuilt whenever the manifest shows that the files
+    have changed.  Iterating yields keys in the order in which they were
+    added.
+
+    ``serializer`` and ``dir_levels`` must match those used to write the data.
+    Gzipped files can't be memory-mapped, and any journal must have been
+    checkpointed.  At most ``max_mapped_files`` files are mapped at a time.
+    """
+
+    def __init__(
+        self,
+        path,
+        serializer=JSONSerializer,
+        dir_levels=0,
+        max_mapped_files=DEFAULT_MAX_MAPPED_FILES,
+    ):
+        if max_mapped_files < 1:
+            raise ValueError('``max_mapped_files`` must be at least 1.')
+
+        self._path = tastypy.normalize_path(path)
+        self._serializer = serializer
+        self._dir_levels = dir_levels
+        self._max_mapped_files = max_mapped_files
+        self._mapped = OrderedDict()
+
+        manifest = self._read_manifest()
+        self._num_files = len(manifest['files'])
+
+        # The index is rebuilt if it was built from a different manifest
+        fingerprint = hashlib.sha1(json.dumps(manifest['files'])).hexdigest()
+        index_path = os.path.join(self._path, INDEX_FNAME)
+        self._index = self._map_index(index_path, fingerprint)
+        if self._index is None:
+            self._build_index(index_path, fingerprint)
+            self._index = self._map_index(index_path, fingerprint)
+        self._len = _UINT64.unpack_from(
+            self._index, _ENTRIES_START - _UINT64.size)[0]
+
+
+    # Keys are normalized the same way as in ``POD``\ s
+    _ensure_unicode = PersistentOrderedDict.__dict__['_ensure_unicode']
+
+
+    def _read_manifest(self):
+        # Read the manifest, checking that the files can be mapped
+        manifest = _load_manifest(os.path.join(self._path, MANIFEST_FNAME))
+        if manifest is None:
+            raise ValueError(
+                'No manifest was found in %s.  A manifest is written whenever '
+                'a POD rewrites its files.' % self._path
+            )
+
+        if manifest.get('format') != self._serializer.format:
+            raise ValueError(
+                'The files in %s were not written in the %s format.'
+                % (self._path, self._serializer.format)
+            )
+        if manifest.get('gzipped'):
+            raise ValueError('Gzipped files can\'t be memory-mapped.')
+        if manifest.get('dir_levels', 0) != self._dir_levels:
+            raise ValueError(
+                'The files in %s are in %d levels of directories, but '
+                '``dir_levels`` is %d.' % (
+                    self._path, manifest.get('dir_levels', 0),
+                    self._dir_levels
+                )
+            )
+
+        journal_path = os.path.join(self._path, JOURNAL_FNAME)
+        if os.path.exists(journal_path) and os.path.getsize(journal_path):
+            raise ValueError(
+                'The data in %s has a journal, which must be checkpointed '
+                'first.' % self._path
+            )
+
+        return manifest
+
+
+    def _file_path(self, file_num):
+        return _file_path(
+            self._path, file_num, self._serializer, False, self._dir_levels)
+
+
+    def _map_index(self, index_path, fingerprint):
+        # Map the index, or return ``None`` if it is missing or stale
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path, 'rb') as f:
+            index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        expected_header = _INDEX_HEADER + fingerprint + '\n'
+        if index[:len(expected_header)] != expected_header:
+            index.close()
+            return None
+        return index
+
+
+    def _build_index(self, index_path, fingerprint):
+        # Index the record of every key.  The index is written under a
+        # temporary name and then renamed, so that other processes never see
+        # a partly written index.
+        entries = []
+        serialize_key = self._serializer.serialize_key
+        for file_num in range(self._num_files):
+            offset = len(self._serializer.header)
+            for key, value, record in _read_entries(
+                self._file_path(file_num), open, self._serializer,
+                keys_only=True, records=True
+            ):
+                entries.append(
+                    (_key_hash(serialize_key(key)), file_num, offset,
+                    len(record))
+                )
+                offset += len(record)
+        entries.sort()
+
+        temp_path = '%s.%d.tmp' % (index_path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            f.write(_INDEX_HEADER + fingerprint + '\n')
+            f.write(_UINT64.pack(len(entries)))
+            f.write(''.join(_INDEX_ENTRY.pack(*entry) for entry in entries))
+        os.rename(temp_path, index_path)
+
+
+    def _map_file(self, file_num):
+        # Get the mapping of a file, unmapping the least recently used file if
+        # too many are mapped
+        mapped = self._mapped
+        if file_num in mapped:
+            mapped[file_num] = mapped.pop(file_num)
+            return mapped[file_num]
+
+        with open(self._file_path(file_num), 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mapped[file_num] = data
+        if len(mapped) > self._max_mapped_files:
+            mapped.popitem(last=False)[1].close()
+        return data
+
+
+    def _find(self, key):
+        # Get the record for ``key``, or ``None`` if it isn't present.  The
+        # entries whose hash matches are found by binary search, and then
+        # checked against the key stored in their records.
+        key = self._ensure_unicode(key)
+        key_hash = _key_hash(self._serializer.serialize_key(key))
+        index = self._index
+        low, high = 0, self._len
+        while low < high:
+            middle = (low + high) / 2
+            position = _ENTRIES_START + middle * _INDEX_ENTRY.size
+            if _UINT64.unpack_from(index, position)[0] < key_hash:
+                low = middle + 1
+            else:
+                high = middle
+
+        for i in xrange(low, self._len):
+            entry_hash, file_num, offset, length = _INDEX_ENTRY.unpack_from(
+                index, _ENTRIES_START + i * _INDEX_ENTRY.size)
+            if entry_hash != key_hash:
+                break
+            record = self._map_file(file_num)[offset:offset+length]
+            if self._serializer.key_from_record(record) == key:
+                return record
+
+        return None
+
+
+    def __getitem__(self, key):
+        record = self._find(key)
+        if record is None:
+            raise KeyError(key)
+        return self._serializer.value_from_record(record)
+
+
+    def get(self, key, default=None):
+        """
+        Return the value at ``key``, or ``default`` if ``key`` isn't present.
+        """
+        record = self._find(key)
+        if record is None:
+            return default
+        return self._serializer.value_from_record(record)
+
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+
+    def __len__(self):
+        return self._len
+
+
+    def __iter__(self):
+        return self.iterkeys()
+
+
+    def _iter_entries(self, keys_only):
+        # Read the entries of each file in turn
+        for file_num in range(self._num_files):
+            for entry in _read_entries(
+                self._file_path(file_num), open, self._serializer, keys_only
+            ):
+                yield entry
+
+
+    def iterkeys(self):
+        """
+        Provide an iterator over keys in the order in which they were added.
+        """
+        for key, value in self._iter_entries(keys_only=True):
+            yield key
+
+
+    def iteritems(self):
+        """
+        Provide an iterator of key-value tuples in the order in which keys
+        were added.
+        """
+        return self._iter_entries(keys_only=False)
+
+
+    def itervalues(self):
+        """
+        Provide an iterator over values in the order in which corresponding
+        keys were added.
+        """
+        for key, value in self._iter_entries(keys_only=False):
+            yield value
+
+
+    def keys(self):
+        """
+        Return a list of keys in the order in which they were added.
+        """
+        return list(self.iterkeys())
+
+
+    def items(self):
+        """
+        Return a list of key-value tuples in the order in which keys were
+        added.
+        """
+        return list(self.iteritems())
+
+
+    def values(self):
+        """
+        Return a list of values in the order in which the corresponding keys
+        were added.
+        """
+        return list(self.itervalues())
+
+
+    def close(self):
+        """
+        Unmap the index and any mapped files.
+        """
+        for data in self._mapped.itervalues():
+            data.close()
+        self._mapped.clear()
+        self._index.close()
+
+
+# Make a shorter alias
+MappedPOD = MappedPersistentOrderedDict
@@ -0,0 +1,316 @@
+"""
+The partitioned persistent ordered dict spreads its keys over several
+``POD``\ s, each in its own directory, which can be on different disks.  Keys
+are assigned to partitions by a stable hash, and the partitions are
+synchronized in parallel.
+"""
+
+import tastypy
+from tastypy.persistent_ordered_dict import (
+    PersistentOrderedDict, _resolve_mode)
+from tastypy.json_serializer import JSONSerializer
+from multiprocessing.pool import ThreadPool
+import hashlib
+import json
+import os
+import struct
+
+
+PARTITION_FNAME = 'partition.json'
+
+
+class PartitionedPersistentOrderedDict(object):
+    """
+    A key-value mapping whose keys are spread over one ``POD`` for each
+    directory in ``paths``.  Each key belongs to the partition chosen by a
+    hash of the key, which doesn't change between runs, so ``paths`` must be
+    given in the same order each time.  Each directory records which
+    partition it holds, and opening them in another order, or with another
+    number of partitions, raises ``ValueError``.
+
+    Iterating yields the keys of each partition in turn, in the order in
+    which they were added to that partition.  ``sync()`` and ``flush()``
+    synchronize the partitions in parallel, using ``sync_workers`` threads
+    (by default, one per partition).  Partitions are also synchronized
+    individually, as their dirty values reach ``sync_at``.  The underlying
+    ``POD``\ s are available as ``partitions``.  ``close()`` closes the
+    partitions and stops the threads, and ``PartitionedPOD``\ s can be used
+    as context managers, which close them on exit.
+
+    ``mode`` and other keyword arguments are passed to each ``POD``.
+    """
+
+    def __init__(self, paths, mode=None, sync_workers=None, **options):
+        if not paths:
+            raise ValueError('At least one path is needed.')
+        if sync_workers is not None and sync_workers < 1:
+            raise ValueError('``sync_workers`` must be at least 1.')
+
+        # The default mode is resolved here, so that it is only warned about
+        # once, rather than by every partition
+        mode = _resolve_mode(mode)
+
+        # If a partition can't be opened, those opened so far are closed
+        self.partitions = []
+        try:
+            for partition_num, path in enumerate(paths):
+                partition = PersistentOrderedDict(path, mode, **options)
+                self.partitions.append(partition)
+                self._check_partition(partition, partition_num, len(paths))
+        except:
+            for partition in self.partitions:
+                partition.close()
+            raise
+
+        self._pool = None
+        if sync_workers is None:
+            sync_workers = len(paths)
+        if sync_workers > 1 and len(paths) > 1:
+            self._pool = ThreadPool(min(sync_workers, len(paths)))
+
+        self.set = tastypy._DeepProxy(self._call_deep)
+
+
+    def _check_partition(self, partition, partition_num, num_partitions):
+        # Check that the partition's directory holds this partition, or, if it
+        # is new, record that it does
+        expected = {
+            'partition': partition_num, 'num_partitions': num_partitions}
+        partition_path = os.path.join(partition._path, PARTITION_FNAME)
+        if os.path.exists(partition_path):
+            with open(partition_path) as f:
+                found = json.load(f)
+            if found != expected:
+                raise ValueError(
+                    '%s holds partition %d of %d, not partition %d of %d.' % (
+                        partition._path, found['partition'],
+                        found['num_partitions'], partition_num,
+                        num_partitions
+                    )
+                )
+        elif len(partition):
+            raise ValueError(
+                '%s holds data that wasn\'t written as a partition.'
+                % partition._path
+            )
+        elif partition.is_writeable():
+            with open(partition_path, 'w') as f:
+                json.dump(expected, f)
+
+
+    # Keys are normalized, and updates are read, the same way as in ``POD``\ s
+    _ensure_unicode = PersistentOrderedDict.__dict__['_ensure_unicode']
+    _iterate_updates = PersistentOrderedDict.__dict__['_iterate_updates']
+
+
+    def _partition_num(self, key):
+        # Get the number of the partition that holds ``key``.  Keys are hashed
+        # in their JSON-serialized form, so that the hash doesn't depend on
+        # the serializer or on the Python process.
+        serialized_key = JSONSerializer.serialize_key(
+            self._ensure_unicode(key))
+        key_hash, = struct.unpack_from(
+            '<Q', hashlib.md5(serialized_key).digest())
+        return key_hash % len(self.partitions)
+
+
+    def _partition(self, key):
+        return self.partitions[self._partition_num(key)]
+
+
+    def _call_deep(self, key_tuple, method_name, *args, **kwargs):
+        # Deep updates made through ``set`` are carried out by the partition
+        # holding the top-level key
+        key = key_tuple[0] if key_tuple else args[0]
+        return self._partition(key)._call_deep(
+            key_tuple, method_name, *args, **kwargs)
+
+
+    def _map_partitions(self, function):
+        # Call ``function`` on each partition, in parallel if there are
+        # workers
+        if self._pool is None:
+            return map(function, self.partitions)
+        return self._pool.map(function, self.partitions)
+
+
+    def __getitem__(self, key):
+        return self._partition(key)[key]
+
+
+    def __setitem__(self, key, val):
+        self._partition(key)[key] = val
+
+
+    def __delitem__(self, key):
+        del self._partition(key)[key]
+
+
+    def __contains__(self, key):
+        return key in self._partition(key)
+
+
+    def __len__(self):
+        return sum(len(partition) for partition in self.partitions)
+
+
+    def __iter__(self):
+        return self.iterkeys()
+
+
+    def pop(self, key, *default):
+        """
+        Remove ``key`` and return its value.  If ``key`` isn't present, return
+        ``default`` if it was given, or else raise ``KeyError``.
+        """
+        return self._partition(key).pop(key, *default)
+
+
+    def update(self, *mappings, **kwargs):
+        """
+        Update self to reflect key-value mappings, and reflect key-value pairs
+        provided as keyword arguments, as in ``POD.update()``.  The updates
+        are grouped by partition, so that each partition is updated once.
+        Returns the number of keys added, and the number of existing keys
+        updated.
+        """
+        partition_updates = [[] for partition in self.partitions]
+        for key, val in self._iterate_updates(*mappings, **kwargs):
+            partition_updates[self._partition_num(key)].append((key, val))
+
+        num_added, num_updated = 0, 0
+        for partition, updates in zip(self.partitions, partition_updates):
+            if updates:
+                added, updated = partition.update(updates)
+                num_added += added
+                num_updated += updated
+        return num_added, num_updated
+
+
+    def mark_dirty(self, key):
+        """
+        Force ``key`` to be considered out of sync.  The data associated to
+        this key will be written to file during the next synchronization.
+        """
+        self._partition(key).mark_dirty(key)
+
+
+    def dirty(self):
+        """
+        Return the set of dirty keys.
+        """
+        return set().union(*[
+            partition.dirty() for partition in self.partitions])
+
+
+    def iterkeys(self):
+        """
+        Provide an iterator over keys, taking the partitions in turn.
+        """
+        for partition in self.partitions:
+            for key in partition.iterkeys():
+                yield key
+
+
+    def iteritems(self):
+        """
+        Provide an iterator of key-value tuples, taking the partitions in turn.
+        """
+        for partition in self.partitions:
+            for item in partition.iteritems():
+                yield item
+
+
+    def itervalues(self):
+        """
+        Provide an iterator over values, taking the partitions in turn.
+        """
+        for partition in self.partitions:
+            for value in partition.itervalues():
+                yield value
+
+
+    def keys(self):
+        """
+        Return a list of keys, taking the partitions in turn.
+        """
+        return list(self.iterkeys())
+
+
+    def items(self):
+        """
+        Return a list of key-value tuples, taking the partitions in turn.
+        """
+        return list(self.iteritems())
+
+
+    def values(self):
+        """
+        Return a list of values, taking the partitions in turn.
+        """
+        return list(self.itervalues())
+
+
+    def sync(self):
+        """
+        Synchronize the dirty values of every partition, in parallel.
+        """
+        self._map_partitions(lambda partition: partition.sync())
+
+
+    def flush(self, wait=True):
+        """
+        Synchronize every partition in parallel, and, in ``background_sync``
+        mode, if ``wait`` is ``True``, block until everything has been
+        written.
+        """
+        self._map_partitions(lambda partition: partition.flush(wait))
+
+
+    def hold(self):
+        """
+        Suspend automatic synchronization of every partition.
+        """
+        for partition in self.partitions:
+            partition.hold()
+
+
+    def unhold(self):
+        """
+        Resume automatic synchronization of every partition.
+        """
+        for partition in self.partitions:
+            partition.unhold()
+
+
+    def close(self):
+        """
+        Close every partition in parallel, which flushes writeable ones, and
+        then stop the threads started for ``sync_workers``.
+        """
+        self._map_partitions(lambda partition: partition.close())
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def revert(self):
+        """
+        Load every partition's values from disk into memory, discarding any
+        unsynchronized changes.
+        """
+        for partition in self.partitions:
+            partition.revert()
+
+
+# Make a shorter alias
+PartitionedPOD = PartitionedPersistentOrderedDict
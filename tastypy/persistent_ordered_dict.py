@@ -13,15 +13,38 @@ program.  It's useful for keeping track of progress in long jobs.
 
 
 import tastypy
+from tastypy._background_writer import BackgroundWriter, write_files
+from tastypy._lazy_values import LazyValues, RawValues
+from tastypy._key_index import KeyIndex
+from tastypy.json_serializer import JSONSerializer, tuplify_lists
+from tastypy.binary_serializer import BinarySerializer
+from cStringIO import StringIO
 import atexit
+import bisect
+import copy
+import hashlib
+import json
+import multiprocessing
 import os
 import gzip
+import re
 import signal
 import sys
+import time
 
 
 DEFAULT_FILE_SIZE = 1000
 DEFAULT_SYNC_AT = 1000
+DEFAULT_CHECKPOINT_AT = 100000
+DEFAULT_MAX_PENDING_SYNCS = 2
+JOURNAL_FNAME = 'journal.json'
+MANIFEST_FNAME = 'manifest.json'
+COMPACTION_FNAME = 'compaction.tmp'
+COMPACTION_PLAN_FNAME = 'compaction.json'
+
+# The number of bytes at the start, and before the offset reached, that are
+# compared to recognize a journal that was partly replayed
+JOURNAL_CHECK_BYTES = 4096
 
 
 def _deep_getitem(container, key_tuple):
@@ -31,6 +54,158 @@ def _deep_getitem(container, key_tuple):
     return value
 
 
+def _init_worker():
+    # Pool workers inherit the POD's SIGTERM handler, which would make them
+    # synchronize the parent's data when the pool is terminated.  This resets
+    # it in workers that the pool starts to replace others.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _worker_pool(num_workers):
+    # The default SIGTERM handler is restored while the workers are forked,
+    # so that a worker terminated before ``_init_worker()`` runs doesn't run
+    # the POD's handler.  Handlers can only be set in the main thread.
+    try:
+        handler = signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    except ValueError:
+        return multiprocessing.Pool(num_workers, initializer=_init_worker)
+    try:
+        return multiprocessing.Pool(num_workers, initializer=_init_worker)
+    finally:
+        signal.signal(signal.SIGTERM, handler)
+
+
+def _read_entries(file_path, opener, serializer, keys_only=False,
+                  records=False):
+    # Read the entries in a file, after checking its header.  If ``records``
+    # is ``True``, each entry's record is read along with its key and value.
+    f = opener(file_path)
+    if f.read(len(serializer.header)) != serializer.header:
+        raise ValueError(
+            'The file does not begin with the %s header.' % serializer.name)
+    if records:
+        return serializer.read_records(f, keys_only)
+    return serializer.read_items(f, keys_only)
+
+
+def _load_file(args):
+    # Read all the entries in a file.  Used by pool workers, so it needs to be
+    # defined at module level.
+    file_path, gzipped, keys_only, records, serializer = args
+    opener = gzip.open if gzipped else open
+    return list(
+        _read_entries(file_path, opener, serializer, keys_only, records))
+
+
+def _encode_file(args):
+    # Serialize the entries of a file, and compress them if needed.  Returns
+    # the data along with the checksum and length of its serialized form.
+    # Used by pool workers, so it needs to be defined at module level.
+    items, gzipped, serializer = args
+    data = serializer.header + ''.join(serializer.dump_items(items))
+    checksum, num_bytes = hashlib.sha1(data).hexdigest(), len(data)
+    if gzipped:
+        data = _compress(data)
+    return data, checksum, num_bytes
+
+
+def _file_path(path, i, serializer, gzipped, dir_levels):
+    # Get the path of the ith file of the data at ``path``.  In nested
+    # layouts, each level of directories is named after the next two digits
+    # of ``i``, counting down from the top level.
+    file_name = '%d.%s' % (i, serializer.extension)
+    if gzipped:
+        file_name += '.gz'
+    if not dir_levels:
+        return os.path.join(path, file_name)
+    dir_names = ['%02d' % (i / 100 ** dir_levels)]
+    dir_names.extend(
+        '%02d' % (i / 100 ** level % 100)
+        for level in range(dir_levels - 1, 0, -1)
+    )
+    return os.path.join(path, *(dir_names + [file_name]))
+
+
+def _compact_key(key):
+    # Get the form in which a key is held with ``compact_keys=True``.  Strings
+    # of ASCII characters are held as ``str``, which takes a fraction of the
+    # memory of ``unicode``, and hashes and compares equal to it.
+    if isinstance(key, unicode):
+        try:
+            return key.encode('ascii')
+        except UnicodeEncodeError:
+            return key
+    if isinstance(key, tuple):
+        return tuple(_compact_key(item) for item in key)
+    return key
+
+
+def _load_manifest(path):
+    # Read the manifest at ``path``, or return ``None`` if there is none, or
+    # if files were being written when it was last appended to.  The manifest
+    # as last rewritten is on the first line, and later synchronizations
+    # append lines: one naming the files about to be written, and then one
+    # holding their entries.  The number of entries appended is recorded as
+    # ``'num_appended'`` (``None`` if the manifest can't be appended to).
+    try:
+        with open(path) as manifest_file:
+            lines = manifest_file.read().split('\n')
+        manifest = json.loads(lines[0])
+        appended = [json.loads(line) for line in lines[1:-1]]
+    except (IOError, ValueError):
+        return None
+
+    # Appends to a manifest that was removed don't make a manifest.
+    # Manifests written without a line ending can only be rewritten, and
+    # anything else without one was cut short.
+    if 'files' not in manifest:
+        return None
+    if len(lines) == 1:
+        manifest['num_appended'] = None
+        return manifest
+    if lines[-1]:
+        return None
+
+    files = manifest['files']
+    manifest['num_appended'] = 0
+    for update in appended:
+        if 'writing' in update:
+            continue
+        for file_num, entry in update['files']:
+            if file_num > len(files):
+                return None
+            files[file_num:file_num+1] = [entry]
+        del files[update['num_files']:]
+        manifest['num_appended'] += len(update['files'])
+    if appended and 'writing' in appended[-1]:
+        return None
+    return manifest
+
+
+def _resolve_mode(mode):
+    # Soon mode will default to 'r' (read only).  The current behavior is
+    # to default to writeable.  Warn users about the coming change.
+    if mode is None:
+        mode = 'w'
+        print (
+            "PODs and Trackers now take a mode flag, like files, e.g. 'r' "
+            "or 'w' for read only or writeable respectively.  In future "
+            "versions, the mode will default to readonly, so you will need "
+            "to explicitly do my_pod = POD(path, 'w') to achieve the usual "
+            "writeable behavior."
+        )
+    return mode
+
+
+def _compress(data):
+    # Gzip data in memory.  Used by pool workers.
+    buf = StringIO()
+    f = gzip.GzipFile(fileobj=buf, mode='wb')
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+
 class PersistentOrderedDict(object):
     """ 
     A key-value mapping that synchronizes transparently to disk at the location
@@ -46,9 +221,102 @@ class PersistentOrderedDict(object):
 
     The JSON-formatted persistence files are gzipped if ``gzipped`` is
     ``True``.    Each file stores a number of values given by ``file_size``.
-    Smaller values give faster synchronization but create more files.  Data is
-    automatically synchronized to disk when the number of "dirty" values
-    reaches ``sync_at``, or if the program terminates.
+    Smaller values give faster synchronization but create more files.  If
+    ``file_bytes`` is given, new entries are also assigned to files by their
+    serialized size, starting a new file before one would exceed
+    ``file_bytes`` bytes, so that rewriting a file costs about the same however
+    large its values are.  Data is automatically synchronized to disk when
+    the number of "dirty" values reaches ``sync_at``, or if the program
+    terminates.  It is also
+    synchronized if, when a value is changed, the oldest unsynchronized change
+    is at least ``sync_every_seconds`` old, or the dirty values are estimated
+    to take at least ``sync_at_bytes`` bytes when serialized.  The estimate
+    is based on the average size of the entries last written.
+
+    Values are written and read by ``serializer``.  Use
+    ``tastypy.FastJSONSerializer`` to write the same files using a faster JSON
+    package, if one is installed, or ``tastypy.BinarySerializer`` to write
+    compact binary files instead (see ``convert()``).
+
+    If ``journal`` is ``True``, synchronization appends the dirty key-value
+    pairs to a journal file rather than rewriting every file that holds a
+    dirty key.  The journal is folded into the numbered files when it reaches
+    ``checkpoint_at`` entries, or whenever ``checkpoint()`` is called.  Any
+    journal found on disk is replayed when the data is loaded.
+
+    Keys can be removed using ``del`` or ``pop()``.  A deleted key is dropped
+    from its file when the file is next rewritten; in journal mode, a
+    tombstone recording the deletion is appended to the journal instead.
+    Files left part-empty by deletions are merged by ``compact()``.
+
+    If ``lazy`` is ``True``, only keys are held in memory when the data is
+    loaded.  The values in a file are loaded the first time that any key
+    stored in that file is accessed.  To bound memory use, set
+    ``max_resident_files`` to the number of files whose values can be held in
+    memory at once.  Beyond that, the least recently used files are dropped
+    from memory, after synchronizing them if they hold changed values (except
+    on ``hold()``, when only files whose values were just looked up are
+    dropped).  See ``cache_stats()``.  To read data without loading it into
+    memory at all, use ``MappedPOD`` instead.
+
+    If ``cache_records`` is ``True``, the serialized form of each entry is
+    kept in memory, so that synchronization only needs to serialize dirty
+    values.  This roughly doubles memory use (in lazy mode, serialized entries
+    are kept for every key), and so it can't be combined with
+    ``max_resident_files``.  Values changed without being marked dirty are
+    not written.
+
+    If ``lazy_decode`` is ``True``, values are kept in their serialized form
+    when the data is loaded, and each is only decoded the first time it is
+    accessed.  Values that are never decoded are written back as they were
+    read.  This can't be combined with ``lazy``.
+
+    Files are kept directly under ``path`` unless ``dir_levels`` is positive,
+    in which case they are spread over that many levels of subdirectories,
+    named after the digits of the file numbers, so that no directory holds
+    more than 100 files or subdirectories (except the top level, once there
+    are more than 100 ** (``dir_levels`` + 1) files).  For example, with two
+    levels, file 1234 is ``00/12/1234.json``.
+
+    Each synchronization that rewrites files also records, in a manifest, the
+    number of entries, size, and checksum of every file.  Synchronizations
+    append the entries of the files they rewrite to the manifest, which is
+    only rewritten in full once more has been appended than it lists, or when
+    ``compact()`` renumbers files, so that its cost stays in proportion to
+    the number of files written.  When the data is
+    loaded, the files are checked against the manifest rather than by listing
+    the directory, and files that don't match it raise
+    ``PersistentOrderedDictIntegrityError``.  If the manifest is missing
+    (e.g. after an interrupted synchronization), the directory is scanned
+    instead.  Synchronization skips files whose contents are the same as the
+    ones last written.
+
+    To keep the data somewhere other than a directory of files, pass a
+    storage backend class as ``storage``, such as ``tastypy.SQLiteStorage``,
+    which keeps it in a SQLite database under ``path`` (see
+    ``tastypy.storage``).  Dirty values are then written to the backend when
+    synchronizing, and in lazy mode, values are loaded from it ``file_size``
+    keys at a time.  Options that arrange files (``gzipped``, ``journal``,
+    ``background_sync``, ``load_workers``, ``write_workers``,
+    ``cache_records``, ``lazy_decode``, ``sync_at_bytes``, ``dir_levels``,
+    and ``file_bytes``) can't be combined with ``storage``.
+
+    To hold many keys in less memory, set ``compact_keys`` to ``True``.  Keys
+    (and strings in tuple keys) made only of ASCII characters are then held,
+    and yielded when iterating, as ``str`` rather than ``unicode``, and the
+    position of each key is indexed in an array rather than a dict.  Lookups
+    are slower, so this suits ``lazy`` mode with many small values best.
+
+    Set ``load_workers`` to the number of processes that should decode files
+    in parallel when data is loaded from disk.  Similarly, set
+    ``write_workers`` to the number of processes that should serialize (and
+    compress) files in parallel when synchronizing.
+
+    If ``background_sync`` is ``True``, synchronization takes a snapshot of
+    the data to be written, and a background thread writes it while the caller
+    carries on.  At most ``max_pending_syncs`` snapshots can wait to be
+    written; beyond that, synchronizing blocks until the writer catches up.
+    Use ``flush()`` to wait until everything has been written.
 
     ``PersistentOrderedDict``\ s opened to the same file path share underlying
     memory so that they don't stale over-write one another's data.  Setting
@@ -57,6 +325,10 @@ class PersistentOrderedDict(object):
 
     _SHARED_POD_STATE = {}
 
+    # Whether ``_read_intercept()`` needs to see values.  If not, values can be
+    # skipped when scanning files in lazy mode.
+    _INTERCEPT_VALUES = False
+
     def __init__(
         self, 
         path,
@@ -66,23 +338,77 @@ class PersistentOrderedDict(object):
         file_size=DEFAULT_FILE_SIZE,
         sync_at=DEFAULT_SYNC_AT,
         clone=True,
+        journal=False,
+        checkpoint_at=DEFAULT_CHECKPOINT_AT,
+        background_sync=False,
+        max_pending_syncs=DEFAULT_MAX_PENDING_SYNCS,
+        load_workers=1,
+        write_workers=1,
+        lazy=False,
+        max_resident_files=None,
+        serializer=JSONSerializer,
+        cache_records=False,
+        lazy_decode=False,
+        sync_every_seconds=None,
+        sync_at_bytes=None,
+        dir_levels=0,
+        file_bytes=None,
+        storage=None,
+        compact_keys=False,
     ):
-        # Soon mode will default to 'r' (read only).  The current behavior is
-        # to default to writeable.  Warn users about the coming change.
-        if mode is None:
-            mode = 'w'
-            print (
-                "PODs and Trackers now take a mode flag, like files, e.g. 'r' "
-                "or 'w' for read only or writeable respectively.  In future "
-                "versions, the mode will default to readonly, so you will need "
-                "to explicitly do my_pod = POD(path, 'w') to achieve the usual "
-                "writeable behavior."
-            )
+        mode = _resolve_mode(mode)
 
         # Validate mode's value
         if mode not in 'rw':
             raise ValueError("Mode must be 'r' or 'w'.")
 
+        # Files can only be dropped from memory if they are loaded lazily
+        if max_resident_files is not None:
+            if not lazy:
+                raise ValueError('``max_resident_files`` requires ``lazy``.')
+            if max_resident_files < 1:
+                raise ValueError('``max_resident_files`` must be at least 1.')
+            if cache_records:
+                raise ValueError(
+                    '``cache_records`` can\'t be combined with '
+                    '``max_resident_files``.'
+                )
+
+
+        if sync_every_seconds is not None and sync_every_seconds <= 0:
+            raise ValueError('``sync_every_seconds`` must be positive.')
+        if sync_at_bytes is not None and sync_at_bytes <= 0:
+            raise ValueError('``sync_at_bytes`` must be positive.')
+
+        if file_bytes is not None and file_bytes <= 0:
+            raise ValueError('``file_bytes`` must be positive.')
+
+        if dir_levels < 0:
+            raise ValueError('``dir_levels`` can\'t be negative.')
+
+        if lazy and lazy_decode:
+            raise ValueError(
+                '``lazy`` and ``lazy_decode`` can\'t be combined.')
+
+        # Storage backends don't keep files, so options for files don't apply
+        if storage is not None:
+            for name, val in [
+                ('gzipped', gzipped), ('journal', journal),
+                ('background_sync', background_sync),
+                ('load_workers', load_workers > 1),
+                ('write_workers', write_workers > 1),
+                ('cache_records', cache_records),
+                ('lazy_decode', lazy_decode),
+                ('sync_at_bytes', sync_at_bytes is not None),
+                ('dir_levels', dir_levels),
+                ('file_bytes', file_bytes is not None),
+            ]:
+                if val:
+                    raise ValueError(
+                        '``%s`` can\'t be combined with ``storage``.' % name)
+
+        # Needed while loading, which happens when sharable attrs are set up
+        self.load_workers = load_workers
 
         # In addition to initializing some of the attributes fo the POD, we'll
         # also identify many of them with class attributes, which produces
@@ -90,13 +416,23 @@ class PersistentOrderedDict(object):
         # multiple PODs are created that point at the same location on disk
         path = tastypy.normalize_path(path)
         self._ensure_path(path)
-        self._init_sharable_attrs(mode, path, gzipped, file_size, clone)
-
-        # Bind the file opening algorithm to self's namespace
-        self._open = gzip.open if gzipped else open
+        self._init_sharable_attrs(
+            mode, path, clone, gzipped=gzipped, file_size=file_size,
+            journal=journal, background_sync=background_sync,
+            max_pending_syncs=max_pending_syncs, write_workers=write_workers,
+            lazy=lazy, max_resident_files=max_resident_files,
+            serializer=serializer, cache_records=cache_records,
+            lazy_decode=lazy_decode, dir_levels=dir_levels,
+            file_bytes=file_bytes, storage=storage,
+            compact_keys=compact_keys
+        )
 
-        # Different clones can have different sync_at, _hold, and values.
+        # Different clones can have different sync_at, checkpoint_at, _hold, 
+        # and values.
         self.sync_at = sync_at
+        self.sync_every_seconds = sync_every_seconds
+        self.sync_at_bytes = sync_at_bytes
+        self.checkpoint_at = checkpoint_at
         self._hold = False
 
         # Mix in any data specified to the init keyword argument
@@ -134,21 +470,78 @@ class PersistentOrderedDict(object):
         return self._SHARED_POD_STATE
 
 
-    def _shared_attrs(self, mode, path, gzipped, file_size):
-        return {
+    def _shared_attrs(self, mode, path, **options):
+        attrs = {
             '_mode': mode,
             '_path': path,
             '_values': {},
             '_keys': [],
             '_index_lookup': {},
             '_dirty': set(),
-            '_open': open,
-            '_gzipped': gzipped,
-            '_file_size': file_size
+            '_journaled': {},
+            '_deleted': [],
+            '_compactable': set(),
+            '_file_starts': [0],
+            '_manifest': [],
+            '_records': {},
+            '_sync_state': {
+                'dirty_since': None, 'record_size': None,
+                'journal_offset': 0, 'journal_head': '',
+                'journal_tail': '', 'closed': False,
+                'manifest_appended': None
+            },
+            '_writer': None,
+            '_write_pool': None,
         }
 
+        # Options are stored as private attributes, e.g. ``_gzipped``
+        for name, val in options.items():
+            attrs['_' + name] = val
+
+        # Bind the file opening algorithm.  This needs to be done before data
+        # is first read.
+        attrs['_open'] = gzip.open if options['gzipped'] else open
+
+        # Records are kept if they are cached, or if values are decoded lazily
+        # from them
+        attrs['_keep_records'] = (
+            options['cache_records'] or options['lazy_decode'])
+        if options['lazy_decode']:
+            attrs['_values'] = RawValues(
+                attrs['_records'], options['serializer'].value_from_record,
+                keep_records=options['cache_records']
+            )
+
+        # Compact keys are indexed by their positions in ``_keys``
+        if options['compact_keys']:
+            attrs['_index_lookup'] = KeyIndex(attrs['_keys'])
+
+        # In lazy mode, values are loaded on demand
+        if options['lazy']:
+            attrs['_values'] = LazyValues(
+                self._load_values, attrs['_index_lookup'].get,
+                self._locate_file,
+                track_recency=options['max_resident_files'] is not None
+            )
+
+        # Entries are kept by the storage backend, if there is one
+        attrs['_store'] = None
+        if options['storage'] is not None:
+            attrs['_store'] = options['storage'](path, options['serializer'])
+
+        # Snapshots are written on a separate thread in background_sync mode
+        if options['background_sync'] and self.is_writeable(mode):
+            attrs['_writer'] = BackgroundWriter(options['max_pending_syncs'])
+
+        # Files are serialized in parallel if there are write_workers.  The
+        # pool is started now, while there is little memory to fork.
+        if options['write_workers'] > 1 and self.is_writeable(mode):
+            attrs['_write_pool'] = _worker_pool(options['write_workers'])
 
-    def _init_sharable_attrs(self, mode, path, gzipped, file_size, clonable):
+        return attrs
+
+
+    def _init_sharable_attrs(self, mode, path, clonable, **options):
         # Instances that point to the same location are made to be "clones" of
         # eachother, by pointing certain "sharable attributes" at the same
         # memory location (using class variables).  This prevents them from
@@ -174,18 +567,12 @@ class PersistentOrderedDict(object):
                 )
 
             # Validate against the existing parameters that must be shared
-            if gzipped != self._gzipped:
-                raise ValueError(
-                    'A POD instance pointed at the same location '
-                    'exists and has a conflicting value for ``gzipped``.'
-                )
-
-            # Validate against the existing parameters that must be shared
-            if file_size != self._file_size:
-                raise ValueError(
-                    'A POD instance pointed at the same location '
-                    'exists and has a conflicting value for ``file_size``.'
-                )
+            for name, val in options.items():
+                if val != getattr(self, '_' + name):
+                    raise ValueError(
+                        'A POD instance pointed at the same location '
+                        'exists and has a conflicting value for ``%s``.' % name
+                    )
 
         # If clonable, but no clone existed, initialize sharable attrs
         elif clonable and not clone_already_exists:
@@ -194,7 +581,7 @@ class PersistentOrderedDict(object):
 
                 # Create the shared space for PODs to this disk location
                 self._get_shared_state()[path] = self._shared_attrs(
-                    mode,path,gzipped,file_size)
+                    mode, path, **options)
 
                 # Identify with the shared space
                 for key in self._get_shared_state()[path]:
@@ -202,21 +589,25 @@ class PersistentOrderedDict(object):
 
         # If not clonable, initialize sharable attrs, but keep them isolate.
         else:
-            for key, val in self._shared_attrs(
-                mode,path,gzipped,file_size
-            ).items():
+            for key, val in self._shared_attrs(mode, path, **options).items():
                 setattr(self, key, val)
 
-        # If we didn't clone an existing clone (maybe because there wasn't one)
-        # do a fresh read from file and register to sync at process exit
-        if not clone_already_exists:
+        # If we didn't clone an existing clone (maybe because there wasn't one,
+        # or because cloning was disabled) do a fresh read from file and
+        # register to sync at process exit
+        if not (clonable and clone_already_exists):
 
-            # Load values from disk into memory.
-            self.revert()
+            # Load values from disk into memory.  If that fails, the worker
+            # processes that were started are stopped.
+            try:
+                self.revert()
+            except:
+                self._release()
+                raise
 
-            # Register to synchronize before the script exits
+            # Register to synchronize and close before the script exits
             if self.is_writeable(mode):
-                atexit.register(self.sync)
+                atexit.register(self.close)
                 signal.signal(signal.SIGTERM, self._sync_on_terminate)
 
 
@@ -226,35 +617,208 @@ class PersistentOrderedDict(object):
         provided as keyword arguments.  Arguments closer to the right take 
         precedence.  Mapping objects must either be iterables of key-value
         tuples or implement ``iteritems()`` yielding such an iterator.
+
+        Automatic synchronization waits until all the updates have been made,
+        so that the files they touch are written at most once.  Returns the
+        number of keys added, and the number of existing keys updated.
         """
+        num_keys = len(self._keys)
+        updated_keys = set()
+        hold, self._hold = self._hold, True
+        try:
+            for key, val in self._iterate_updates(*mappings, **kwargs):
+                key = self._ensure_unicode(key)
+                index = self._index_lookup.get(key)
+                is_new = index is None
+                if is_new:
+                    key = self._add_key(key)
+                else:
+                    key = self._keys[index]
+                self._update_value(key, val, is_new)
+                updated_keys.add(key)
+
+                # Keys are marked dirty as soon as they are updated, so that
+                # in lazy mode, their files aren't dropped from memory while
+                # the files of later keys are loaded
+                self._note_change()
+                self._dirty.add(key)
+
+        finally:
+            self._hold = hold
+
+        self._maybe_sync()
+        num_added = len(self._keys) - num_keys
+        return num_added, len(updated_keys) - num_added
 
+
+    def _iterate_updates(self, *mappings, **kwargs):
+        # Yield the key-value pairs given to ``update()``, in order
         for mapping in mappings:
             if hasattr(mapping, 'keys'):
                 for key in mapping:
-                    self.__setitem__(key, mapping[key])
+                    yield key, mapping[key]
             else:
                 for key, val in mapping:
-                    self.__setitem__(key, val)
+                    yield key, val
 
         for key in kwargs:
-            self.__setitem__(key, kwargs[key])
+            yield key, kwargs[key]
+
+
+    def _update_value(self, key, val, is_new):
+        # Store a value given to ``update()``
+        self._values[key] = val
+
+
+    @classmethod
+    def bulk_load(cls, path, items, **options):
+        """
+        Create a ``POD`` at ``path``, which must not hold any data yet, from
+        an iterable of key-value tuples, and return it opened in ``'w'`` mode.
+        Other keyword arguments are passed to the constructor.
+
+        Entries are written directly to files as they are read from
+        ``items``, and are registered in memory as if they had been read from
+        the files.  In ``lazy`` mode, only the keys are held in memory.  As
+        with ``update()``, keys are ordered by their first occurrence, and
+        later values for a key replace earlier ones.  With a ``storage``
+        backend, the entries are simply added using ``update()``.
+        """
+        pod = cls(path, mode='w', **options)
+        if len(pod):
+            raise ValueError('``bulk_load()`` requires an empty POD.')
+        if pod._store is not None:
+            pod.update(items)
+            pod.sync()
+            return pod
+        write_files([(None, pod._manifest_path(), None, None)])
+
+        # Write entries to files as the files fill up.  Later values for keys
+        # that have already been written are applied afterwards.  If files
+        # are limited by size, entries are serialized as they arrive, so that
+        # they can be measured (the sizes of merged entries aren't updated).
+        index = pod._index_lookup
+        header_bytes = len(pod._serializer.header)
+        patches = {}
+        entries = []
+        num_bytes = header_bytes
+        for key, value in items:
+            key = pod._ensure_unicode(key)
+
+            # Handle repeated keys
+            if key in index:
+                file_num = pod._file_num(key)
+                if file_num == len(pod._manifest):
+                    entry = entries[index[key] - pod._file_starts[-1]]
+                    entry[1] = pod._bulk_merge(entry[1], value)
+                    entry[2] = None
+                else:
+                    file_patches = patches.setdefault(file_num, {})
+                    if key in file_patches:
+                        value = pod._bulk_merge(file_patches[key], value)
+                    file_patches[key] = value
+                continue
+
+            value = pod._bulk_value(value)
+            record = None
+            if pod._file_bytes is not None:
+                record = next(pod._serializer.dump_items([(key, value)]))
+            if entries and pod._is_full(len(entries), num_bytes, record):
+                pod._bulk_write(len(pod._manifest), entries)
+                pod._file_starts.append(len(pod._keys))
+                entries = []
+                num_bytes = header_bytes
+
+            key = pod._add_key(key)
+            entries.append([key, value, record])
+            if record is not None:
+                num_bytes += len(record)
+
+        if entries:
+            pod._bulk_write(len(pod._manifest), entries)
+
+        # Apply later values to the files holding their keys
+        for file_num, file_patches in patches.iteritems():
+            entries = [
+                [key, value, None] for key, value in _read_entries(
+                    pod._path_from_int(file_num), pod._open, pod._serializer)
+            ]
+            old_values = {}
+            for entry in entries:
+                if entry[0] in file_patches:
+                    old_values[entry[0]] = entry[1]
+                    entry[1] = pod._bulk_merge(
+                        entry[1], file_patches[entry[0]])
+            pod._bulk_write(file_num, entries, old_values)
+
+        write_files(
+            [(open, pod._manifest_path(), 'w', pod._manifest_data())])
+        return pod
+
+
+    def _bulk_write(self, file_num, entries, old_values=None):
+        # Write a file of entries during ``bulk_load()``, and register them.
+        # Entries are ``[key, value, record]`` lists, and are serialized if
+        # their record is ``None``.  If ``old_values`` is given, the file is
+        # being rewritten, and only the entries whose old values it holds are
+        # registered again.
+        stale = [entry for entry in entries if entry[2] is None]
+        stale_records = self._serializer.dump_items(
+            (key, value) for key, value, record in stale)
+        for entry, record in zip(stale, stale_records):
+            entry[2] = record
+        data = self._serializer.header + ''.join(
+            record for key, value, record in entries)
+        write_files([(self._open, self._path_from_int(file_num), 'w', data)])
+        self._note_manifest(
+            file_num, len(entries), hashlib.sha1(data).hexdigest())
+
+        for key, value, record in entries:
+            if old_values is not None:
+                if key not in old_values:
+                    continue
+                self._discard_intercept(key, old_values[key])
+
+            key, value = self._read_intercept(key, value)
+            if not (self._lazy or self._lazy_decode):
+                self._values[key] = value
+            if self._keep_records:
+                self._records[key] = record
+
+
+    def _bulk_value(self, value):
+        # Get the value to store for a key's first value in ``bulk_load()``
+        return value
+
+
+    def _bulk_merge(self, value, new_value):
+        # Combine a key's value with a later value given to ``bulk_load()``
+        return new_value
 
 
     def _sync_on_terminate(self, sig_num, frame):
-        # Wraps sync() so that it can be registered as a SIGTERM handler
-        self.sync()
+        # Wraps flush() so that it can be registered as a SIGTERM handler
+        self.flush()
         sys.exit(0)
 
 
     def __iter__(self):
-        return self._keys.__iter__()
+        return self._live_keys()
+
+
+    def _live_keys(self):
+        # Iterate over keys in order, skipping the gaps left by deleted keys
+        if len(self._keys) == len(self._index_lookup):
+            return self._keys.__iter__()
+        return (key for key in self._keys if key is not None)
+
 
     def iteritems(self):
         """
         Provide an iterator of key-value tuples in the order in which keys were
         added.
         """
-        for key in self._keys:
+        for key in self._live_keys():
             yield key, self._values.__getitem__(key)
 
 
@@ -262,7 +826,7 @@ class PersistentOrderedDict(object):
         """
         Provide an iterator over keys in the order in which they were added.
         """
-        return self._keys.__iter__()
+        return self._live_keys()
 
 
     def itervalues(self):
@@ -270,7 +834,7 @@ class PersistentOrderedDict(object):
         Provide an iterator over values in the order in which corresponding
         keys were added.
         """
-        for key in self._keys:
+        for key in self._live_keys():
             yield self._values.__getitem__(key)
 
 
@@ -279,14 +843,15 @@ class PersistentOrderedDict(object):
         Return a list of key-value tuples in the order in which keys were
         added.
         """
-        return [(key, self._values.__getitem__(key)) for key in self._keys]
+        return [
+            (key, self._values.__getitem__(key)) for key in self._live_keys()]
 
 
     def keys(self):
         """
         Return a list of keys in the order in which they were added.
         """
-        return list(self._keys)
+        return list(self._live_keys())
 
 
     def values(self):
@@ -294,7 +859,7 @@ class PersistentOrderedDict(object):
         Return a list of values in the order in which the corresponding keys
         were added.
         """
-        return [self._values.__getitem__(key) for key in self._keys]
+        return [self._values.__getitem__(key) for key in self._live_keys()]
 
 
     def mark_dirty(self, key):
@@ -303,6 +868,7 @@ class PersistentOrderedDict(object):
         this key will be written to file during the next synchronization.
         """
         key = self._ensure_unicode(key)
+        self._note_change()
         self._dirty.add(key)
 
 
@@ -324,48 +890,633 @@ class PersistentOrderedDict(object):
 
     def sync(self):
         """
-        Force synchronization of all dirty values.
+        Force synchronization of all dirty values.  In journal mode, dirty
+        values are appended to the journal, which is checkpointed once it holds
+        ``checkpoint_at`` entries.  In ``background_sync`` mode, this returns
+        once the values have been handed to the writer thread (see
+        ``flush()``).
+        """
+        if not self.is_writeable():
+            raise ValueError("Attempting to write to disk when mode is 'r'.")
+
+        if self._store is not None:
+            self._store_writes()
+            return
+
+        if self._journal:
+            writes = self._journal_writes()
+            if sum(self._journaled.itervalues()) >= self.checkpoint_at:
+                writes.extend(self._checkpoint_writes())
+        else:
+            writes = self._checkpoint_writes()
+
+        self._commit(writes)
+
+
+    def checkpoint(self):
+        """
+        Rewrite every file holding a dirty or journaled value, and then discard
+        the journal.  Outside of journal mode this is equivalent to ``sync()``.
         """
         if not self.is_writeable():
             raise ValueError("Attempting to write to disk when mode is 'r'.")
+        if self._store is not None:
+            self._store_writes()
+            return
+        self._commit(self._checkpoint_writes())
+
+
+    def compact(self, max_files=None):
+        """
+        Merge files left part-empty by deletions with as many of the files
+        after them as fit within ``file_size`` entries, and renumber the later
+        files to close the gap.  The data is checkpointed first.  At most
+        ``max_files`` part-empty files are compacted, so that compaction can be
+        spread over many calls, and in ``background_sync`` mode the files are
+        written by the writer thread.  Returns the number of part-empty files
+        that remain.  A ``storage`` backend has no files to merge, so it is
+        only synchronized.  A compaction that is interrupted is finished when
+        the data is next opened in ``'w'`` mode.
+        """
+        self.checkpoint()
+        if self._store is not None:
+            self._compactable.clear()
+            return 0
+
+        # Every file on disk gets an explicit start, as files will be merged
+        starts = self._file_starts
+        while len(starts) < len(self._manifest):
+            starts.append(starts[-1] + self._file_size)
+
+        num_compacted = 0
+        while self._compactable and (
+            max_files is None or num_compacted < max_files
+        ):
+            self._commit(self._compaction_writes(min(self._compactable)))
+            num_compacted += 1
+
+        return len(self._compactable)
+
+
+    def _compaction_writes(self, first):
+        # Merge file ``first`` with the files after it that fit (judging the
+        # size of entries by the average), and renumber the files after
+        # those.  The merged file is written under a temporary name, and then
+        # a plan of the compaction is written, before any file is touched, so
+        # that an interrupted compaction can be finished when the data is next
+        # opened for writing (see ``_finish_compaction()``).
+        self._compactable.discard(first)
+        num_files = len(self._manifest)
+        if first >= num_files:
+            return []
+        keys = self._file_keys(first)
+        stop = first + 1
+        max_entries = self._file_size
+        record_size = self._sync_state['record_size']
+        if self._file_bytes is not None and record_size:
+            max_entries = min(max_entries, int(self._file_bytes / record_size))
+        while stop < num_files:
+            next_keys = self._file_keys(stop)
+            if len(keys) + len(next_keys) > max_entries:
+                break
+            keys.extend(next_keys)
+            stop += 1
+
+        # A file that can't be merged is already compact on disk
+        if keys and stop == first + 1:
+            return []
+
+        writes = [(None, self._manifest_path(), None, None)]
+        merged = []
+        if keys:
+            data, checksum = self._encode_keys(keys)
+            writes.append((self._open, self._compaction_path(), 'w', data))
+            merged.append([len(keys), None, checksum])
+        plan = {
+            'first': first, 'stop': stop, 'num_files': num_files,
+            'merged': bool(keys)
+        }
+        writes.append(
+            (open, self._compaction_plan_path(), 'w', json.dumps(plan)))
+        writes.extend(self._compaction_moves(plan))
+        num_removed = stop - first - len(merged)
+
+        # Merged files span the gaps left by their deleted keys.  If the last
+        # file was merged, new keys go in a new file.
+        starts = self._file_starts
+        new_starts = [starts[first]] if keys else []
+        if stop == num_files and len(starts) == num_files:
+            new_starts.append(len(self._keys))
+        starts[first:stop] = new_starts
+        self._manifest[first:stop] = merged
+
+        # Renumber the files after the merged ones
+        later = [num for num in self._compactable if num >= stop]
+        self._compactable.difference_update(range(first, stop) + later)
+        self._compactable.update(num - num_removed for num in later)
+        if self._lazy:
+            self._values.merge_files(first, stop, keys, num_removed)
+
+        writes.append(
+            (open, self._manifest_path(), 'w', self._manifest_data()))
+        writes.append((None, self._compaction_plan_path(), None, None))
+        return writes
+
+
+    def _compaction_moves(self, plan, resume=False):
+        # Get the removals and renames that replace the files merged by the
+        # compaction described by ``plan`` with the merged file (if any), and
+        # renumber the files after them.  Merged files are removed from last
+        # to first, and then later files are renamed from first to last, so
+        # the missing file numbers always form a single gap.  If ``resume`` is
+        # ``True``, the moves already made are skipped, judging by the gap.
+        first, stop, num_files = plan['first'], plan['stop'], plan['num_files']
+        temp_path = self._compaction_path()
+        path = self._path_from_int
+        base = first + 1 if plan['merged'] else first
+        num_removed = stop - base
+        removals = range(first, stop)
+        rename_from = stop
+        rename_temp = plan['merged']
+        if resume and not (plan['merged'] and os.path.exists(temp_path)):
+            rename_temp = False
+            gap = base
+            while gap < num_files and os.path.exists(path(gap)):
+                gap += 1
+            gap_end = gap
+            while gap_end < num_files and not os.path.exists(path(gap_end)):
+                gap_end += 1
+
+            # A gap as wide as the removed files means that renaming has
+            # reached it.  A narrower one is left by unfinished removals.
+            if gap_end - gap >= num_removed:
+                removals, rename_from = [], gap_end
+            else:
+                removals = range(first, min(gap, stop))
+
+        moves = [
+            (None, path(file_num), None, None)
+            for file_num in reversed(removals)
+        ]
+        if rename_temp:
+            moves.append((os.rename, temp_path, path(first), None))
+        moves.extend(
+            (os.rename, path(file_num), path(file_num - num_removed), None)
+            for file_num in range(rename_from, num_files)
+        )
+        return moves
+
+
+    def _finish_compaction(self):
+        # Finish any compaction that was interrupted, following its plan.  If
+        # there is no complete plan, no file had been touched yet, and only
+        # the merged file needs to be removed.  The manifest is removed, as
+        # it may predate the compaction, so that the files are scanned.
+        plan_path = self._compaction_plan_path()
+        try:
+            with open(plan_path) as f:
+                plan = json.load(f)
+        except (IOError, ValueError):
+            plan = None
+
+        writes = []
+        if plan is not None:
+            writes.append((None, self._manifest_path(), None, None))
+            writes.extend(self._compaction_moves(plan, resume=True))
+        writes.append((None, self._compaction_path(), None, None))
+        writes.append((None, plan_path, None, None))
+        write_files(writes)
+
+
+    def flush(self, wait=True):
+        """
+        Synchronize all dirty values.  In ``background_sync`` mode, if
+        ``wait`` is ``True``, block until the writer thread has written
+        everything, re-raising any error it encountered.
+        """
+        self.sync()
+        if wait and self._writer is not None:
+            self._writer.wait()
+
+
+    def close(self):
+        """
+        Flush any unsynchronized changes (if writeable), stop the processes
+        started for ``write_workers``, and close any ``storage`` backend.
+        These are shared with clones of this ``POD``, which shouldn't be used
+        afterwards either.  Writeable ``POD``\ s are closed automatically when
+        the program exits, and ``POD``\ s can be used as context managers,
+        which close them on exit.
+        """
+        if self._sync_state['closed']:
+            return
+        if self.is_writeable():
+            self.flush()
+        self._release()
+
+
+    def _release(self):
+        # Stop the worker processes, close the storage backend, and forget
+        # the shared state, so that ``POD``\ s opened to this path later start
+        # afresh
+        self._sync_state['closed'] = True
+        if self._write_pool is not None:
+            self._write_pool.terminate()
+            self._write_pool.join()
+        if self._store is not None:
+            self._store.close()
+        shared_state = self._get_shared_state()
+        if shared_state.get(self._path, {}).get('_keys') is self._keys:
+            del shared_state[self._path]
+
 
-        dirty_files = set()
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def pending_syncs(self):
+        """
+        Return the number of synchronizations that are waiting to be written
+        by the writer thread (always ``0`` unless in ``background_sync``
+        mode).
+        """
+        if self._writer is None:
+            return 0
+        return self._writer.pending()
+
+
+    def _store_writes(self):
+        # Write deletions and dirty values to the storage backend, adding new
+        # keys in order
+        if not (self._dirty or self._deleted):
+            return
+        dirty_keys = sorted(self._dirty, key=self._index_lookup.__getitem__)
+        self._store.write(
+            [key for file_num, key in self._deleted],
+            [(key, self._values[key]) for key in dirty_keys]
+        )
+        self._dirty.clear()
+        del self._deleted[:]
+
+
+    def _commit(self, writes):
+        # Carry out writes now, or hand them to the writer thread
+        if self._writer is None:
+            write_files(writes)
+        else:
+            self._writer.submit(writes)
+
+
+    def _checkpoint_writes(self):
+        # Snapshot the files holding dirty or journaled values as a list of
+        # writes, and discard the journal whose contents they include.
+
+        # Files holding values that are only recorded in the journal need to be
+        # rewritten along with those holding dirty values
+        dirty_files = set(self._journaled)
+        dirty_files.update(file_num for file_num, key in self._deleted)
         for key in self._dirty:
-            index = self._index_lookup[key]
-            file_num = index / self._file_size
-            dirty_files.add(file_num)
+            dirty_files.add(self._file_num(key))
 
         # The write directory should exist, but ensure it.
         self._ensure_path(self._path)
 
-        # Rewrite all the dirty files
-        for file_num in dirty_files:
+        # If files are limited by size, the last file is split into as many
+        # files as it needs as it is serialized
+        tail = {}
+        if (
+            self._file_bytes is not None
+            and len(self._file_starts) - 1 in dirty_files
+        ):
+            tail = self._split_tail()
+
+        # Get the keys that belong in each dirty file
+        file_nums = sorted(dirty_files.difference(tail))
+        file_keys = [self._file_keys(file_num) for file_num in file_nums]
+
+        # Serialize and compress files in parallel if there are workers.
+        # Otherwise just serialize here, leaving compression to the writer.
+        # If records are cached, only dirty values need to be serialized, and
+        # only compression is done in parallel.  Sizes are measured before
+        # compression, like ``file_bytes``.
+        opener, mode = self._open, 'w'
+        parallel = self._write_pool is not None and len(file_nums) > 1
+        if parallel and not self._keep_records:
+            encoded = self._write_pool.map(_encode_file, [
+                (
+                    [(k, self._values[k]) for k in keys], self._gzipped,
+                    self._serializer
+                )
+                for keys in file_keys
+            ])
+            num_bytes = sum(size for _, _, size in encoded)
+            encoded = [(data, checksum) for data, checksum, _ in encoded]
+            opener, mode = open, 'wb'
+        else:
+            encoded = [self._encode_keys(keys) for keys in file_keys]
+            num_bytes = sum(len(data) for data, _ in encoded)
+            if parallel and self._gzipped:
+                datas = self._write_pool.map(
+                    _compress, [data for data, checksum in encoded])
+                encoded = [
+                    (data, checksum)
+                    for data, (_, checksum) in zip(datas, encoded)
+                ]
+                opener, mode = open, 'wb'
+
+        files = [
+            (file_num, len(keys), data, checksum, opener, mode)
+            for file_num, keys, (data, checksum)
+            in zip(file_nums, file_keys, encoded)
+        ]
+        files.extend(
+            (file_num, num_entries, data, checksum, self._open, 'w')
+            for file_num, (num_entries, data, checksum) in tail.iteritems()
+        )
+        files.sort()
+        num_bytes += sum(len(data) for _, data, _ in tail.itervalues())
+        self._note_record_size(
+            num_bytes,
+            sum(num_entries for _, num_entries, _, _, _, _ in files)
+        )
+
+        # Rewrite the dirty files, skipping those whose contents are the same
+        # as on disk (keys are marked dirty whenever they are accessed).
+        file_nums, file_writes = [], []
+        for file_num, num_entries, data, checksum, opener, mode in files:
+            if self._is_unchanged(file_num, checksum):
+                continue
+            file_nums.append(file_num)
+            file_writes.append(
+                (opener, self._path_from_int(file_num), mode, data))
+            self._note_manifest(file_num, num_entries, checksum)
+
+        writes = []
+        if file_writes:
+            writes.extend(self._manifest_writes(file_nums, file_writes))
+
+        # The journal is folded into the files.  It is removed even if nothing
+        # has been journaled yet, in case an append is still waiting to be
+        # written.
+        if self._journal or self._journaled:
+            writes.append((None, self._journal_path(), None, None))
+            self._journaled.clear()
+
+        # No more dirty or deleted keys
+        self._dirty.clear()
+        del self._deleted[:]
+
+        return writes
+
+
+    def _split_tail(self):
+        # Serialize the last file, splitting it into files of at most
+        # ``file_bytes`` bytes and ``file_size`` entries (files hold at least
+        # one entry).  Returns the number of entries, data, and checksum of
+        # each resulting file, by file number.
+        starts = self._file_starts
+        file_num = len(starts) - 1
+        indices = [
+            i for i in xrange(starts[file_num], len(self._keys))
+            if self._keys[i] is not None
+        ]
+        keys = [self._keys[i] for i in indices]
+        if self._keep_records:
+            records = self._cached_records(keys)
+        else:
+            records = list(self._serializer.dump_items(
+                (k, self._values[k]) for k in keys))
+
+        files = {}
+        header_bytes = len(self._serializer.header)
+        first, num_bytes = 0, header_bytes
+        for i, record in enumerate(records):
+            if i > first and self._is_full(i - first, num_bytes, record):
+                files[file_num] = self._file_data(records[first:i])
+                file_num += 1
+                starts.append(indices[i])
+                first, num_bytes = i, header_bytes
+            num_bytes += len(record)
+        files[file_num] = self._file_data(records[first:])
+        if self._lazy:
+            self._values.end_run()
+        return files
+
+
+    def _is_full(self, num_entries, num_bytes, record=None):
+        # Whether a file holding ``num_entries`` entries in ``num_bytes`` bytes
+        # is too full to take another entry, whose record is ``record``
+        if num_entries >= self._file_size:
+            return True
+        return (
+            self._file_bytes is not None
+            and num_bytes + len(record) > self._file_bytes
+        )
+
+
+    def _file_data(self, records):
+        # Get the number of entries, data, and checksum of a file of records
+        data = self._serializer.header + ''.join(records)
+        return len(records), data, hashlib.sha1(data).hexdigest()
+
+
+    def _encode_keys(self, keys):
+        # Serialize the entries for ``keys`` as the contents of a file.
+        # Returns the data along with its checksum.
+        if self._keep_records:
+            records = self._cached_records(keys)
+        else:
+            records = self._serializer.dump_items(
+                (k, self._values[k]) for k in keys)
+        data = self._serializer.header + ''.join(records)
+        return data, hashlib.sha1(data).hexdigest()
+
+
+    def _cached_records(self, keys):
+        # Get the records for ``keys``, serializing only the values of keys
+        # that are dirty or have no cached record.
+        records = self._records
+        stale_keys = [
+            k for k in keys if k in self._dirty or k not in records]
+        stale_records = self._serializer.dump_items(
+            (k, self._values[k]) for k in stale_keys)
+        for key, record in zip(stale_keys, stale_records):
+            records[key] = record
+        return [records[k] for k in keys]
+
+
+    def _journal_path(self):
+        return os.path.join(self._path, JOURNAL_FNAME)
+
+
+    def _manifest_path(self):
+        return os.path.join(self._path, MANIFEST_FNAME)
+
 
-            # Get the dirty file
-            path =  self._path_from_int(file_num)
-            f = self._open(path, 'w')
+    def _compaction_path(self):
+        return os.path.join(self._path, COMPACTION_FNAME)
 
-            # Get the keys that belong in this file
-            start = file_num * self._file_size
-            stop = start + self._file_size
-            relevant_keys = self._keys[start:stop]
 
-            # Serialize the data and write the file
-            serializer = tastypy.JSONSerializer.dump_items(
-                (k, self._values[k]) for k in relevant_keys
+    def _compaction_plan_path(self):
+        return os.path.join(self._path, COMPACTION_PLAN_FNAME)
+
+
+    def _is_unchanged(self, file_num, checksum):
+        # Whether the file, as last written, has the given checksum
+        return (
+            file_num < len(self._manifest)
+            and self._manifest[file_num][2] == checksum
+        )
+
+
+    def _note_manifest(self, file_num, num_entries, checksum):
+        # Record a rewritten file in the manifest.  Its size is only known once
+        # it has been written.
+        entry = [num_entries, None, checksum]
+        if file_num < len(self._manifest):
+            self._manifest[file_num] = entry
+        else:
+            self._manifest.append(entry)
+
+
+    def _manifest_writes(self, file_nums, file_writes):
+        # Surround ``file_writes``, which rewrite the files ``file_nums``,
+        # with updates to the manifest, so that it never vouches for partly
+        # written files.  The files are named in an append before they are
+        # written, and their entries are appended after.  Once more entries
+        # have been appended than the manifest lists, it is removed first and
+        # rewritten last instead.
+        state = self._sync_state
+        num_appended = state['manifest_appended']
+
+        # A manifest that was removed since it was written is rewritten
+        if self.pending_syncs() == 0 and not os.path.exists(
+            self._manifest_path()
+        ):
+            num_appended = None
+
+        if (
+            num_appended is None
+            or num_appended + len(file_nums) > len(self._manifest)
+        ):
+            return (
+                [(None, self._manifest_path(), None, None)] + file_writes
+                + [(open, self._manifest_path(), 'w', self._manifest_data())]
             )
-            for line in serializer:
-                f.write(line)
 
-        # No more dirty keys
+        state['manifest_appended'] = num_appended + len(file_nums)
+        entries = [
+            [file_num, list(self._manifest[file_num])]
+            for file_num in file_nums
+        ]
+        num_files = len(self._manifest)
+
+        def render():
+            for file_num, entry in entries:
+                self._fill_size(file_num, entry)
+            update = {'files': entries, 'num_files': num_files}
+            return json.dumps(update) + '\n'
+
+        writing = json.dumps({'writing': file_nums}) + '\n'
+        return (
+            [(open, self._manifest_path(), 'a', writing)] + file_writes
+            + [(open, self._manifest_path(), 'a', render)]
+        )
+
+
+    def _fill_size(self, file_num, entry):
+        # Fill in the size of a written file in a snapshot of its manifest
+        # entry
+        if entry[1] is None:
+            entry[1] = os.path.getsize(self._path_from_int(file_num))
+            self._note_size(file_num, entry)
+
+
+    def _manifest_data(self):
+        # Snapshot the manifest.  It is rendered by the writer, once the files
+        # have been written and their sizes can be filled in.  Later
+        # synchronizations can append to it.
+        files = [list(entry) for entry in self._manifest]
+        self._sync_state['manifest_appended'] = 0
+
+        def render():
+            for file_num, entry in enumerate(files):
+                self._fill_size(file_num, entry)
+            return json.dumps({
+                'file_size': self._file_size,
+                'gzipped': self._gzipped,
+                'serializer': self._serializer.name,
+                'format': self._serializer.format,
+                'dir_levels': self._dir_levels,
+                'files': files,
+            }) + '\n'
+
+        return render
+
+
+    def _note_size(self, file_num, written_entry):
+        # Copy a written file's size into the manifest held in memory, unless
+        # the file has been changed (or compacted) since.
+        if file_num >= len(self._manifest):
+            return
+        entry = self._manifest[file_num]
+        if entry[1] is None and entry[2] == written_entry[2]:
+            entry[1] = written_entry[1]
+
+
+    def _journal_writes(self):
+        # Snapshot dirty values as an append to the journal.  Keys are written
+        # in order of insertion so that, on replay, new keys get their original
+        # positions.
+        if not (self._dirty or self._deleted):
+            return []
+
+        # Deletions are journaled as tombstones, whose key is ``None`` and
+        # whose value is the deleted key.  They go first, so that a key that
+        # was deleted and then added again is replayed in that order.
+        self._ensure_path(self._path)
+        tombstones = list(self._serializer.dump_items(
+            (None, key) for file_num, key in self._deleted))
+        dirty_keys = sorted(self._dirty, key=self._index_lookup.__getitem__)
+        serialized = list(self._serializer.dump_items(
+            (k, self._values[k]) for k in dirty_keys
+        ))
+        writes = [
+            (open, self._journal_path(), 'a', ''.join(tombstones + serialized))
+        ]
+        self._note_record_size(
+            len(writes[0][3]), len(tombstones) + len(dirty_keys))
+        if self._keep_records:
+            self._records.update(zip(dirty_keys, serialized))
+
+        # Remember which files are now out of date until the next checkpoint
+        for file_num, key in self._deleted:
+            self._note_journaled(file_num)
+        for key in dirty_keys:
+            self._note_journaled(self._file_num(key))
         self._dirty.clear()
+        del self._deleted[:]
+
+        return writes
+
+
+    def _note_journaled(self, file_num):
+        # Count a journal entry against the file that it changes
+        self._journaled[file_num] = self._journaled.get(file_num, 0) + 1
 
 
     def hold(self):
         """
         Suspend the automatic synchronization to disk that normally occurs when
         the number of dirty values reaches ``sync_at``.  (Synchronization will
-        still be carried out at termination.)
+        still be carried out at termination.)  With ``max_resident_files``,
+        files whose values have changed can't be dropped from memory while
+        on hold, since they can't be written, so more files may be held.
+        Files whose values were only looked up are still dropped.
         """
         self._hold = True
 
@@ -383,16 +1534,201 @@ class PersistentOrderedDict(object):
         Load values from disk into memory, discarding any unsynchronized
         changes.
         """
+        # Let the writer thread finish, so that files are read in full
+        if self._writer is not None:
+            self._writer.wait()
+
         # Clear core data
         self._keys[:] = []
         self._index_lookup.clear()
         self._values.clear()
         self._dirty.clear()
+        self._journaled.clear()
+        del self._deleted[:]
+        self._compactable.clear()
+        self._manifest[:] = []
+        self._records.clear()
 
         # read in all data (if any)
         self._read()
 
 
+    def refresh(self):
+        """
+        Pick up the changes that another process has written since the data
+        was loaded or last refreshed, without reading everything again.  Only
+        the files that the manifest shows to have changed are read, and only
+        new journal entries are replayed.  Changes that can't be applied in
+        place, such as compaction, cause everything to be read again, as in
+        ``revert()``, as does any change to a ``ProgressTracker`` opened with
+        ``lazy=True``.  This is meant for ``POD``\ s opened in ``'r'`` mode.
+
+        Returns the number of files read, or ``None`` if the writer was in the
+        middle of synchronizing, in which case nothing changes, and
+        ``refresh()`` can simply be called again.  With a ``storage``
+        backend, everything is read again, and ``0`` is returned.
+        """
+        if self.is_writeable():
+            raise ValueError(
+                '``refresh()`` is only for PODs opened in \'r\' mode.')
+        if self._store is not None:
+            self.revert()
+            return 0
+
+        # Without a manifest, the writer is in the middle of writing files,
+        # unless it hasn't written any yet
+        manifest = self._read_manifest()
+        if manifest is None:
+            if self._manifest or os.path.exists(self._path_from_int(0)):
+                return None
+            manifest = {
+                'format': self._serializer.format,
+                'dir_levels': self._dir_levels, 'file_size': self._file_size,
+                'gzipped': self._gzipped, 'files': []
+            }
+        files = manifest['files']
+        if (
+            manifest.get('format', JSONSerializer.format)
+                != self._serializer.format
+            or manifest.get('dir_levels', 0) != self._dir_levels
+            or manifest.get('file_size') != self._file_size
+            or manifest.get('gzipped') != self._gzipped
+            or len(files) < len(self._manifest)
+        ):
+            self.revert()
+            return len(self._manifest)
+
+        changed = set(
+            i for i, entry in enumerate(files)
+            if i >= len(self._manifest) or self._manifest[i] != entry
+        )
+
+        # Once the journal has been checkpointed, the files holding changes
+        # replayed from it need to be read again, even if they are unchanged.
+        # So does the last file, since keys added by the journal after it may
+        # since have been deleted.
+        # Only new journal entries are read, unless files changed, in which
+        # case the whole journal is replayed over them.
+        state = self._sync_state
+        journal_offset, journal = self._read_journal(
+            0 if changed else state['journal_offset'])
+        checkpointed = (
+            bool(changed) or journal_offset != state['journal_offset'])
+        if checkpointed:
+            changed.update(i for i in self._journaled if i < len(files))
+            changed.add(len(self._manifest) - 1)
+            changed.discard(-1)
+        changed = sorted(changed)
+        if changed and self._lazy and self._INTERCEPT_VALUES:
+            self.revert()
+            return len(self._manifest)
+
+        # Read the changed files in full before applying anything, and only
+        # apply them if the manifest didn't change in the meantime
+        keys_only = (
+            (self._lazy or self._lazy_decode)
+            and not self._INTERCEPT_VALUES
+        )
+        try:
+            file_entries = [
+                list(_read_entries(
+                    self._path_from_int(i), self._open, self._serializer,
+                    keys_only, self._keep_records
+                ))
+                for i in changed
+            ]
+        except (IOError, ValueError):
+            return None
+        if changed and self._read_manifest() != manifest:
+            return None
+        if checkpointed:
+            self._journaled.clear()
+
+        # Files already read get explicit starts, as new files start wherever
+        # their first key is found
+        starts = self._file_starts
+        while len(starts) < len(self._manifest):
+            starts.append(starts[-1] + self._file_size)
+        last = len(self._manifest) - 1
+        tail_start = starts[max(last, 0)]
+        tail_keys = set()
+        for file_num, entries in zip(changed, file_entries):
+            if not self._refresh_file(file_num, entries, keys_only):
+                self.revert()
+                return len(self._manifest)
+            if file_num < len(self._manifest):
+                self._manifest[file_num] = list(files[file_num])
+            else:
+                self._manifest.append(list(files[file_num]))
+            if file_num >= last:
+                tail_keys.update(entry[0] for entry in entries)
+
+        # Keys from the journal that were deleted before being checkpointed
+        # are in none of the files, which may leave no files to read
+        if checkpointed:
+            for key in self._keys[tail_start:]:
+                if key is not None and key not in tail_keys:
+                    self._remove(key, return_value=False)
+
+        self._replay_journal(journal_offset, journal)
+        return len(changed)
+
+
+    def _refresh_file(self, file_num, entries, keys_only):
+        # Apply the entries read from a changed file: update the values of
+        # keys already held, append new keys, and remove keys that are gone.
+        # Returns ``False`` if keys turn up outside of the file they belong to
+        # here, or in a different order (e.g. a key that was deleted and added
+        # again), which means that the keys were rearranged.
+        starts = self._file_starts
+        if file_num >= len(starts):
+            if entries and entries[0][0] in self._index_lookup:
+                starts.append(self._index_lookup[entries[0][0]])
+            else:
+                starts.append(len(self._keys))
+            if self._lazy:
+                self._values.end_run()
+        removed = set(self._file_keys(file_num))
+
+        prev_position = -1
+        for entry in entries:
+            key, value = entry[0], entry[1]
+            position = self._index_lookup.get(key)
+            if position is not None:
+                if self._file_of_index(position) != file_num:
+                    return False
+                if position < prev_position:
+                    return False
+                key = self._keys[position]
+                removed.discard(key)
+                if not keys_only:
+                    self._discard_held(key)
+            else:
+                key = self._add_key(key)
+                position = len(self._keys)-1
+                if self._file_of_index(position) != file_num:
+                    return False
+            prev_position = position
+
+            if not keys_only:
+                key, value = self._read_intercept(key, value)
+            if not (self._lazy or keys_only):
+                self._values[key] = value
+            elif self._lazy_decode:
+                self._values.pop(key, None)
+            if self._keep_records:
+                self._records[key] = entry[2]
+
+        for key in removed:
+            self._remove(key, return_value=False)
+
+        # Values of a lazy ``POD`` are read again when next needed
+        if self._lazy and file_num in self._values.loaded:
+            self._values.evict(file_num, self._file_keys(file_num))
+
+        return True
+
+
     def _ensure_path(self, path):
 
         # if the path doesn't exist, make it
@@ -409,52 +1745,231 @@ class PersistentOrderedDict(object):
 
     def _path_from_int(self, i):
         # Get the ith synchronization file's full path.
-        if self._gzipped:
-            return os.path.join(self._path, '%d.json.gz' % i)
-        else:
-            return os.path.join(self._path, '%d.json' % i)
+        return _file_path(
+            self._path, i, self._serializer, self._gzipped, self._dir_levels)
 
 
     def _read(self):
+        if self._store is not None:
+            self._read_store()
+            return
+
+        # A compaction that was interrupted is finished before anything is
+        # read.  Until then, files may be missing or renumbered.
+        if self.is_writeable():
+            self._finish_compaction()
+        elif (
+            os.path.exists(self._compaction_plan_path())
+            and not os.path.exists(self._manifest_path())
+        ):
+            raise tastypy.PersistentOrderedDictIntegrityError(
+                'The files in %s are being compacted.  If the compaction was '
+                'interrupted, opening them in \'w\' mode will finish it.'
+                % self._path
+            )
+
+        # The manifest says which files to read.  If it can't be trusted, look
+        # for the files instead, and rewrite the manifest when next syncing.
+        self._sync_state['manifest_appended'] = None
+        file_paths = self._manifest_file_paths()
+        if file_paths is None:
+            file_paths = self._scan_file_paths()
+
+        # Values are only needed if they will be intercepted, or kept in
+        # memory
+        keys_only = (
+            (self._lazy or self._lazy_decode)
+            and not self._INTERCEPT_VALUES
+        )
+
+        # Files may be decoded in parallel, but are registered in order
+        pool = None
+        if self.load_workers > 1 and len(file_paths) > 1:
+            pool = _worker_pool(self.load_workers)
+            file_entries = pool.imap(_load_file, [
+                (
+                    path, self._gzipped, keys_only, self._keep_records,
+                    self._serializer
+                )
+                for path in file_paths
+            ])
+        else:
+            file_entries = (
+                _read_entries(
+                    path, self._open, self._serializer, keys_only,
+                    self._keep_records
+                )
+                for path in file_paths
+            )
+
+        try:
+            self._register_files(file_paths, file_entries, keys_only)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        # Apply any changes that were journaled but not yet checkpointed
+        self._replay_journal(*self._read_journal(0))
+
+        # Estimate the size of entries from the files, unless they are
+        # compressed, in which case it waits for the first write
+        sized_files = [
+            entry for entry in self._manifest
+            if entry[1] and not self._gzipped
+        ]
+        self._note_record_size(
+            sum(entry[1] for entry in sized_files),
+            sum(entry[0] for entry in sized_files)
+        )
+
+
+    def _read_store(self):
+        # Register the entries held by the storage backend.  In lazy mode,
+        # values are not kept.
+        keys_only = self._lazy and not self._INTERCEPT_VALUES
+        for key, value in self._store.read(keys_only):
+            key = self._add_key(key)
+            if not keys_only:
+                key, value = self._read_intercept(key, value)
+            if not self._lazy:
+                self._values[key] = value
+
+
+    def _manifest_file_paths(self):
+        # Get the paths of the files listed in the manifest, followed by any
+        # files written after it, or ``None`` if there is no manifest, or it
+        # was written with other options.  The manifest is removed while files
+        # are being written, so files that don't match it are corrupt.
+        manifest = self._read_manifest()
+        if manifest is None:
+            return None
+
+        # Files written in another format can't be read
+        written_format = manifest.get('format', JSONSerializer.format)
+        if written_format != self._serializer.format:
+            raise ValueError(
+                'The files in %s were written by the %s serializer, whose '
+                'format (%s) can\'t be read by the %s serializer.' % (
+                    self._path, manifest.get('serializer'), written_format,
+                    self._serializer.name
+                )
+            )
+
+        # Files in another layout can't be found
+        written_levels = manifest.get('dir_levels', 0)
+        if written_levels != self._dir_levels:
+            raise ValueError(
+                'The files in %s are in %d levels of directories, but '
+                '``dir_levels`` is %d.'
+                % (self._path, written_levels, self._dir_levels)
+            )
 
-        # Read each file found in path that matches the naming format
-        naming_format = '\d+\.json.gz' if self._gzipped else '\d+\.json'
-        file_iterator = tastypy.ls(
-            self._path, dirs=False, absolute=True, match=naming_format)
-        for i, file_path in enumerate(file_iterator):
+        if (
+            manifest.get('file_size') != self._file_size
+            or manifest.get('gzipped') != self._gzipped
+        ):
+            return None
+
+        # Each file should have the recorded size.  The number of entries in
+        # each is checked as the files are read.
+        files = manifest['files']
+        file_paths = [self._path_from_int(i) for i in range(len(files))]
+        for file_path, (num_entries, size, checksum) in zip(file_paths, files):
+            if not os.path.isfile(file_path):
+                raise tastypy.PersistentOrderedDictIntegrityError(
+                    'The file %s, which is listed in the manifest, is '
+                    'missing.' % file_path
+                )
+            if os.path.getsize(file_path) != size:
+                raise tastypy.PersistentOrderedDictIntegrityError(
+                    'The file %s appears to be corrupted, because it has %d '
+                    'bytes (the manifest records %d).'
+                    % (file_path, os.path.getsize(file_path), size)
+                )
 
-            # Detect gaps in numbering of file names (indicates missing file)
+        # Files added after the manifest was written are read as if scanned
+        while os.path.exists(self._path_from_int(len(file_paths))):
+            file_paths.append(self._path_from_int(len(file_paths)))
+
+        self._manifest[:] = [list(entry) for entry in files]
+        self._sync_state['manifest_appended'] = manifest['num_appended']
+        return file_paths
+
+
+    def _read_manifest(self):
+        # Read the manifest, or return ``None`` if there is none
+        return _load_manifest(self._manifest_path())
+
+
+    def _scan_file_paths(self):
+
+        # Read each file found in path that matches the naming format.  In
+        # nested layouts, files are looked for at every level, and sorted by
+        # number, so that misplaced files show up as missing.
+        naming_format = '/\d+\.%s' % re.escape(self._serializer.extension)
+        naming_format += '\.gz$' if self._gzipped else '$'
+        if self._dir_levels:
+            file_paths = [
+                os.path.join(dir_path, file_name)
+                for dir_path, dir_names, file_names in os.walk(self._path)
+                for file_name in file_names
+                if re.search(naming_format, '/' + file_name)
+            ]
+            file_paths.sort(
+                key=lambda p: int(os.path.basename(p).split('.', 1)[0]))
+        else:
+            file_paths = tastypy.ls(
+                self._path, dirs=False, absolute=True, match=naming_format)
+
+        # Detect gaps in numbering of file names (indicates missing file)
+        for i, file_path in enumerate(file_paths):
             if file_path != self._path_from_int(i):
                 raise tastypy.PersistentOrderedDictIntegrityError(
                     'Expected %s but found %s.  File missing?' 
                     % (self._path_from_int(i), file_path)
                 )
 
-            # Check if the previous file (if any) had the right number of lines
-            if i > 0 and prev_num_entries != self._file_size: 
+        return file_paths
+
+
+    def _register_files(self, file_paths, file_entries, keys_only):
+        # Register the entries from each file, in file order, checking that
+        # no file is over-full.  Files can hold fewer than ``file_size``
+        # entries once keys have been deleted, so the index at which each file
+        # starts is recorded.  In lazy mode, values are not kept.
+        starts = self._file_starts
+        del starts[:]
+        for i, file_path in enumerate(file_paths):
+
+            # Check if the previous file (if any) had too many lines
+            if i > 0 and prev_num_entries > self._file_size:
                 raise tastypy.PersistentOrderedDictIntegrityError(
                     "The file %s appears to be corrupted, because it has "
-                    "%d lines (instead of %d)." 
+                    "%d lines (instead of at most %d)."
                     % (prev_file_path, prev_num_entries, self._file_size)
                 )
 
             # Read all the data from this file.  Record number of entries, to 
             # be verified if this isn't the last file.
+            starts.append(len(self._keys))
             prev_file_path = file_path
             prev_num_entries = 0
             try:
-                deserialized = tastypy.JSONSerializer.read_items(
-                    self._open(file_path))
-                for key, value in deserialized:
+                for entry in next(file_entries):
+                    key, value = entry[0], entry[1]
                     prev_num_entries += 1
+                    key = self._add_key(key)
 
                     # Allow subclasses to intercept and re-interpret lines
-                    key, value = self._read_intercept(key, value)
+                    if not keys_only:
+                        key, value = self._read_intercept(key, value)
 
                     # Register the data
-                    self._values[key] = value
-                    self._keys.append(key)
-                    self._index_lookup[key] = len(self._keys)-1
+                    if not (self._lazy or keys_only):
+                        self._values[key] = value
+                    if self._keep_records:
+                        self._records[key] = entry[2]
 
             # Contextualize parsing errors (can be due to bad JSON format)
             except ValueError as error:
@@ -464,11 +1979,300 @@ class PersistentOrderedDict(object):
                     % (self._path_from_int(i), str(error))
                 )
 
+            # Check the file against the manifest, or add it to the manifest
+            # if it was found by scanning.  Scanned files have no checksum.
+            if i < len(self._manifest):
+                if self._manifest[i][0] != prev_num_entries:
+                    raise tastypy.PersistentOrderedDictIntegrityError(
+                        "The file %s appears to be corrupted, because it has "
+                        "%d lines (the manifest records %d)."
+                        % (file_path, prev_num_entries, self._manifest[i][0])
+                    )
+            else:
+                self._manifest.append(
+                    [prev_num_entries, os.path.getsize(file_path), None])
+
+            # Part-empty files can be merged by ``compact()``
+            if prev_num_entries < self._file_size and (
+                i < len(file_paths) - 1 or prev_num_entries == 0
+            ):
+                self._compactable.add(i)
+
+        if not starts:
+            starts.append(0)
+
+
+    def _read_journal(self, offset):
+        # Read the journal from ``offset``, or from the start if it is no
+        # longer the journal that was replayed up to ``offset`` (judging by
+        # its first bytes and the bytes before ``offset``).  Returns the
+        # offset read from, and the data, which is empty if there is no
+        # journal.
+        state = self._sync_state
+        try:
+            journal = open(self._journal_path(), 'rb')
+        except IOError:
+            return 0, ''
+        with journal:
+            if offset:
+                head = journal.read(len(state['journal_head']))
+                journal.seek(offset - len(state['journal_tail']))
+                tail = journal.read(len(state['journal_tail']))
+                if (head, tail) != (
+                    state['journal_head'], state['journal_tail']
+                ):
+                    offset = 0
+            journal.seek(offset)
+            return offset, journal.read()
+
+
+    def _replay_journal(self, offset, data):
+
+        # Replay the journal's ``data``, read from ``offset``.  Only complete
+        # records are replayed.  An incomplete last record means the process
+        # died (or is still) appending, and that entry was never synced.
+        state = self._sync_state
+        journal_path = self._journal_path()
+        num_bytes = 0
+        records = self._serializer.read_records(
+            StringIO(data), complete_only=True)
+        try:
+            for key, value, record in records:
+                num_bytes += len(record)
+
+                # Tombstones hold the key that was deleted
+                if key is None:
+                    key = tuplify_lists(value)
+                    if key in self._index_lookup:
+                        self._note_journaled(
+                            self._remove(key, return_value=False)[1])
+                    continue
+
+                # Replayed values supersede the ones read from the files
+                index = self._index_lookup.get(key)
+                if index is not None:
+                    key = self._keys[index]
+                    self._discard_held(key)
+                else:
+                    key = self._add_key(key)
+
+                key, value = self._read_intercept(key, value)
+                self._values[key] = value
+                if self._keep_records:
+                    self._records[key] = record
+                self._note_journaled(self._file_num(key))
+
+        # Contextualize parsing errors (can be due to bad JSON format)
+        except ValueError as error:
+            raise tastypy.PersistentOrderedDictIntegrityError(
+                'PersistentOrderedDict: The journal %s appears to be '
+                'corrupted:\n%s' % (journal_path, str(error))
+            )
+
+        # Remember where replaying stopped, and the bytes that identify the
+        # journal replayed so far
+        replayed = data[:num_bytes]
+        if not offset:
+            state['journal_head'] = state['journal_tail'] = ''
+        state['journal_head'] = (
+            state['journal_head'] + replayed[:JOURNAL_CHECK_BYTES]
+        )[:JOURNAL_CHECK_BYTES]
+        state['journal_tail'] = (
+            state['journal_tail'] + replayed[-JOURNAL_CHECK_BYTES:]
+        )[-JOURNAL_CHECK_BYTES:]
+        state['journal_offset'] = offset + num_bytes
+
+
+    def _load_values(self, key):
+        # Load values from the file holding ``key`` (in lazy mode).  Values
+        # already in memory are newer than those on disk, so they are kept,
+        # and entries for keys that have since been deleted are skipped.
+        # Values loaded this way don't pass through ``_read_intercept()``,
+        # which has already seen them while the keys were being loaded.
+        if key not in self._index_lookup:
+            return
+        file_num = self._file_num(key)
+        if file_num in self._values.loaded:
+            return
+        self._read_values(file_num)
+
+        # The file only counts as loaded once its values are held, and other
+        # files are then dropped to make room for it
+        self._values.loaded[file_num] = True
+        self._evict_files(keep=file_num)
+
+
+    def _read_values(self, file_num):
+        # Read the values of keys in file ``file_num`` that aren't in memory
+
+        # Backends load the values of the keys that would be in the file
+        if self._store is not None:
+            index = self._index_lookup
+            for k, v in self._store.load(self._file_keys(file_num)):
+                if k not in self._values:
+                    self._values[self._keys[index[k]]] = v
+            return
+
+        # The file might be waiting to be written, if it was evicted recently
+        if self._writer is not None:
+            self._writer.wait()
+
+        # The file won't exist yet if its keys were all added since the last
+        # synchronization
+        file_path = self._path_from_int(file_num)
+        if not os.path.exists(file_path):
+            return
+
+        start, stop = self._file_bounds(file_num)
+        index = self._index_lookup
+        try:
+            for k, v in _read_entries(
+                file_path, self._open, self._serializer
+            ):
+                position = index.get(k, -1)
+                if start <= position < stop and k not in self._values:
+                    self._values[self._keys[position]] = v
+        except ValueError as error:
+            raise tastypy.PersistentOrderedDictIntegrityError(
+                'PersistentOrderedDict: The file %s disk appears to be '
+                'corrupted:\n%s' % (file_path, str(error))
+            )
+
+
+    def _file_num(self, key):
+        # Get the number of the file that holds ``key``
+        return self._file_of_index(self._index_lookup[key])
+
+
+    def _locate_file(self, key):
+        # Get the number of the file that holds ``key``, and the range of
+        # indices that the file holds
+        file_num = self._file_num(key)
+        return (file_num,) + self._file_bounds(file_num)
+
+
+    def _file_of_index(self, index):
+        # Get the number of the file that holds the key at ``index``.  Files
+        # after the last one in ``_file_starts`` hold ``file_size`` keys,
+        # unless files are limited by size, in which case the last file holds
+        # every key after its start until it is split.
+        starts = self._file_starts
+        last = len(starts) - 1
+        if index >= starts[last]:
+            if self._file_bytes is not None:
+                return last
+            return last + (index - starts[last]) / self._file_size
+        return bisect.bisect_right(starts, index) - 1
+
+
+    def _file_bounds(self, file_num):
+        # Get the range of indices held by a file.  The range includes the
+        # gaps left by deleted keys.
+        starts = self._file_starts
+        last = len(starts) - 1
+        if file_num < last:
+            return starts[file_num], starts[file_num + 1]
+        if self._file_bytes is not None:
+            return starts[last], len(self._keys)
+        start = starts[last] + (file_num - last) * self._file_size
+        return start, start + self._file_size
+
+
+    def _file_keys(self, file_num):
+        # Get the keys held in a file, in order
+        start, stop = self._file_bounds(file_num)
+        return [key for key in self._keys[start:stop] if key is not None]
+
+
+    def _exceeds_resident_files(self):
+        return (
+            self._max_resident_files is not None
+            and len(self._values.loaded) > self._max_resident_files
+        )
+
+
+    def _evict_files(self, keep=None):
+        # Drop the values of the least recently used files from memory until
+        # at most ``max_resident_files`` remain.  Files holding changed or
+        # journaled values can't be dropped until they have been written, and
+        # file ``keep``, which has just been loaded, is never dropped.
+        if not self._exceeds_resident_files():
+            return
+
+        unwritten_files = set(self._journaled)
+        unwritten_files.update(file_num for file_num, key in self._deleted)
+        dirty_keys = {}
+        for key in self._dirty:
+            dirty_keys.setdefault(self._file_num(key), []).append(key)
+
+        excess = len(self._values.loaded) - self._max_resident_files
+        for file_num in list(self._values.loaded):
+            if excess == 0:
+                break
+            if file_num in unwritten_files or file_num == keep:
+                continue
+
+            # Keys are marked dirty when they are looked up, but if their
+            # values still match the file, it can be dropped without being
+            # written (which matters on ``hold()``)
+            if file_num in dirty_keys:
+                if not self._matches_file(file_num):
+                    continue
+                self._dirty.difference_update(dirty_keys[file_num])
+
+            self._values.evict(file_num, self._file_keys(file_num))
+            excess -= 1
+
+
+    def _matches_file(self, file_num):
+        # Whether the values held for file ``file_num`` serialize to the file
+        # as last written.  Values are read without counting as lookups.
+        records = self._serializer.dump_items(
+            (key, dict.__getitem__(self._values, key))
+            for key in self._file_keys(file_num)
+        )
+        data = self._serializer.header + ''.join(records)
+        return self._is_unchanged(file_num, hashlib.sha1(data).hexdigest())
+
+
+    def cache_stats(self):
+        """
+        In lazy mode, return a dict of counts: the number of times values were
+        looked up in a file that was already held in memory (``'hits'``), the
+        number of times a file had to be loaded (``'misses'``), the number of
+        files dropped from memory (``'evictions'``), and the number of files
+        currently held in memory (``'resident_files'``).  Successive lookups
+        in the same file count once, so reading the values of a file just
+        loaded doesn't count as hits.
+        """
+        if not self._lazy:
+            raise ValueError('Cache statistics are only kept in lazy mode.')
+        return {
+            'hits': self._values.hits,
+            'misses': self._values.misses,
+            'evictions': self._values.evictions,
+            'resident_files': len(self._values.loaded),
+        }
+
 
     def _read_intercept(self, key, val):
         return key, val
 
 
+    def _discard_intercept(self, key, val):
+        # Called when a value that passed through ``_read_intercept`` is
+        # superseded, so that subclasses can undo any bookkeeping.
+        pass
+
+
+    def _discard_held(self, key):
+        # Call ``_discard_intercept()`` for the value held at ``key``.  The
+        # value is only looked up if ``_read_intercept()`` sees values, so
+        # that in lazy mode, files aren't loaded just to discard their values.
+        if self._INTERCEPT_VALUES:
+            self._discard_intercept(key, self._values[key])
+
+
     def is_writeable(self, mode=None):
         """
         Indicates whether self's mode, or the mode passed in, corresponds to 
@@ -485,9 +2289,52 @@ class PersistentOrderedDict(object):
             return
         if self._hold:
             return
-        if len(self._dirty) < self.sync_at - preemptive:
+
+        # If too many files are in memory because they hold unwritten values,
+        # write them so that they can be dropped
+        if self._exceeds_resident_files():
+            self.checkpoint()
+            self._evict_files()
             return
-        self.sync()
+
+        if (
+            len(self._dirty) + len(self._deleted) >= self.sync_at - preemptive
+            or self._sync_due(preemptive)
+        ):
+            self.sync()
+
+
+    def _sync_due(self, preemptive=0):
+        # Whether synchronization is called for by the age of the oldest
+        # unsynchronized change, or by the estimated size of dirty values
+        if not self._dirty and not self._deleted:
+            return False
+
+        record_size = self._sync_state['record_size']
+        if self.sync_at_bytes is not None and record_size is not None:
+            pending_bytes = (len(self._dirty) + preemptive) * record_size
+            if pending_bytes >= self.sync_at_bytes:
+                return True
+
+        if self.sync_every_seconds is not None:
+            age = time.time() - self._sync_state['dirty_since']
+            if age >= self.sync_every_seconds:
+                return True
+
+        return False
+
+
+    def _note_change(self):
+        # Record the time of the oldest unsynchronized change, if there are no
+        # others yet
+        if not self._dirty and not self._deleted:
+            self._sync_state['dirty_since'] = time.time()
+
+
+    def _note_record_size(self, num_bytes, num_entries):
+        # Update the estimated size of serialized entries
+        if num_entries:
+            self._sync_state['record_size'] = num_bytes / float(num_entries)
 
 
     def __contains__(self, key):
@@ -496,7 +2343,7 @@ class PersistentOrderedDict(object):
 
 
     def __len__(self):
-        return len(self._keys)
+        return len(self._index_lookup)
 
 
     def __getitem__(self, key):
@@ -518,8 +2365,34 @@ class PersistentOrderedDict(object):
         return self._values[key]
 
 
+    def peek(self, key):
+        """
+        Return a copy of the value at ``key`` without marking ``key`` dirty,
+        so that looking it up never causes it to be written.  Changes made to
+        the copy are not stored.
+        """
+        return copy.deepcopy(self._peek(key))
+
+
+    def _add_key(self, key):
+        # Append a new key, returning the object held for it
+        if self._compact_keys:
+            key = _compact_key(key)
+        self._keys.append(key)
+        self._index_lookup[key] = len(self._keys)-1
+        return key
+
+
+    def _peek(self, key):
+        # Get the value at ``key`` without marking it dirty.  The value must
+        # not be mutated.
+        return self._values[self._ensure_unicode(key)]
+
+
     def _ensure_unicode(self, key):
         # Forces str-like keys to be unicode
+        if isinstance(key, unicode):
+            return key
 
         # ensure that the key is a valid type
         if not isinstance(key, (basestring, tuple, int)):
@@ -533,7 +2406,10 @@ class PersistentOrderedDict(object):
             temp_key = []
             for item in key:
                 temp_key.append(self._ensure_unicode(item))
-            key = tuple(temp_key)
+
+            # Tuples that were already unicode throughout are kept
+            if any(new is not old for new, old in zip(temp_key, key)):
+                key = tuple(temp_key)
 
         # Ensure that strings are unicode
         elif isinstance(key, basestring) and not isinstance(key, unicode):
@@ -548,16 +2424,62 @@ class PersistentOrderedDict(object):
         # Ensure key is unicode
         key = self._ensure_unicode(key)
 
-        # If we're making a new key, do so.
-        if key not in self._values:
-            self._keys.append(key)
-            self._index_lookup[key] = len(self._keys)-1
+        # If we're making a new key, do so.  Otherwise, use the key object
+        # that is already held.
+        index = self._index_lookup.get(key)
+        if index is None:
+            key = self._add_key(key)
+        else:
+            key = self._keys[index]
 
         # Update the value held at ``key``
         self._values[key] = val
         self.mark_dirty(key)
         self._maybe_sync()
-        
+
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+
+    def pop(self, key, *default):
+        """
+        Remove ``key`` and return its value.  If ``key`` isn't present, return
+        ``default`` if it was given, or else raise ``KeyError``.
+        """
+        key = self._ensure_unicode(key)
+        if key not in self._index_lookup:
+            if default:
+                return default[0]
+            raise KeyError(key)
+
+        value, file_num = self._remove(key)
+        self._note_change()
+        self._deleted.append((file_num, key))
+        self._maybe_sync()
+        return value
+
+
+    def _remove(self, key, return_value=True):
+        # Remove ``key`` from memory.  Its place in ``_keys`` is left as a gap,
+        # so that other keys keep their indices.  Returns the removed value
+        # (``None`` unless ``return_value`` is ``True``) and the number of the
+        # file that held it.
+        value = None
+        if return_value:
+            value = self._values[key]
+            self._discard_intercept(key, value)
+        else:
+            self._discard_held(key)
+        index = self._index_lookup.pop(key)
+        self._keys[index] = None
+        self._values.pop(key, None)
+        self._records.pop(key, None)
+        self._dirty.discard(key)
+        file_num = self._file_of_index(index)
+        self._compactable.add(file_num)
+        return value, file_num
+
 
     def convert_to_tracker(self):
 
@@ -579,3 +2501,107 @@ class PersistentOrderedDict(object):
 
 # Make a shorter alias
 POD = PersistentOrderedDict
+
+
+def reshard(
+    path,
+    new_path,
+    file_size=DEFAULT_FILE_SIZE,
+    gzipped=False,
+    serializer=JSONSerializer,
+    from_file_size=DEFAULT_FILE_SIZE,
+    from_gzipped=False,
+    from_serializer=JSONSerializer,
+    workers=1,
+    dir_levels=0,
+    from_dir_levels=0,
+    file_bytes=None,
+):
+    """
+    Copy the data stored at ``path`` to ``new_path``, which must not hold any
+    data yet, writing it in files of ``file_size`` entries, gzipped if
+    ``gzipped``, using ``serializer``, in ``dir_levels`` levels of
+    directories.  Files are also limited to ``file_bytes`` bytes, if it is
+    given.  The data at ``path`` is read using ``from_file_size``,
+    ``from_gzipped``, ``from_serializer``, and ``from_dir_levels``, including
+    any journal that hasn't been checkpointed.
+
+    Only keys are held in memory, along with the values of a few files at a
+    time.  Files are decoded by ``workers`` processes in parallel, and written
+    as they fill up (see ``PersistentOrderedDict.bulk_load()``).
+    """
+    if tastypy.normalize_path(path) == tastypy.normalize_path(new_path):
+        raise ValueError('Data must be resharded to a different path.')
+
+    source = PersistentOrderedDict(
+        path, 'r', clone=False, gzipped=from_gzipped,
+        file_size=from_file_size, serializer=from_serializer, lazy=True,
+        dir_levels=from_dir_levels
+    )
+    PersistentOrderedDict.bulk_load(
+        new_path, _reshard_items(source, workers), clone=False,
+        gzipped=gzipped, file_size=file_size, serializer=serializer,
+        lazy=True, dir_levels=dir_levels, file_bytes=file_bytes
+    )
+
+
+def _reshard_items(source, workers):
+    # Yield the items of ``source``, a lazy POD, reading its files in batches
+    # of ``workers``.  Values held in memory were replayed from the journal,
+    # and supersede the files.
+    journaled = source._values
+    file_args = [
+        (
+            source._path_from_int(file_num), source._gzipped, False, False,
+            source._serializer
+        )
+        for file_num in range(len(source._manifest))
+    ]
+    pool = _worker_pool(workers) if workers > 1 else None
+    try:
+        for first in range(0, len(file_args), workers):
+            batch = file_args[first:first+workers]
+            if pool is None:
+                batch_entries = map(_load_file, batch)
+            else:
+                batch_entries = pool.map(_load_file, batch)
+            for file_num, entries in enumerate(batch_entries, first):
+                values = dict(entries)
+                for key in source._file_keys(file_num):
+                    if dict.__contains__(journaled, key):
+                        yield key, dict.__getitem__(journaled, key)
+                    else:
+                        yield key, values[key]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # Keys added by the journal after the last file
+    start = source._file_bounds(len(file_args))[0]
+    for key in source._keys[start:]:
+        if key is not None:
+            yield key, dict.__getitem__(journaled, key)
+
+
+def convert(
+    path,
+    new_path,
+    serializer=BinarySerializer,
+    gzipped=False,
+    file_size=DEFAULT_FILE_SIZE,
+    from_serializer=JSONSerializer,
+    from_gzipped=False,
+    from_file_size=DEFAULT_FILE_SIZE,
+):
+    """
+    Copy the data stored at ``path`` to ``new_path``, writing it with
+    ``serializer``, ``gzipped``, and ``file_size``.  The data at ``path`` is
+    read using ``from_serializer``, ``from_gzipped``, and ``from_file_size``.
+    This is ``reshard()`` with the binary format as the default.
+    """
+    reshard(
+        path, new_path, file_size=file_size, gzipped=gzipped,
+        serializer=serializer, from_file_size=from_file_size,
+        from_gzipped=from_gzipped, from_serializer=from_serializer
+    )
@@ -34,14 +34,39 @@ class ProgressTracker(tastypy.PersistentOrderedDict):
     equivalent to calling ``update(init_arg)`` after creating the ``POD``.    
 
     The JSON-formatted persistence files are gzipped if ``gzipped`` is
-    ``True``.    Each file stores a number of values given by ``file_size``.
-    Smaller values give faster synchronization but create more files.  Data is
-    automatically synchronized to disk when the number of "dirty" values
-    reaches ``sync_at``, or if the program terminates.
+    ``True``.    Each file stores a number of values given by ``file_size``,
+    and, if ``file_bytes`` is given, is started before it would exceed that
+    many bytes.  Smaller files give faster synchronization but create more
+    files.  Data is automatically synchronized to disk when the number of
+    "dirty" values reaches ``sync_at``, or if the program terminates.  Set
+    ``sync_every_seconds`` or ``sync_at_bytes`` to also synchronize based on
+    the age or estimated size of unsynchronized changes.
+
+    Set ``journal`` to ``True`` to append dirty values to a journal during
+    synchronization, folding it into the files every ``checkpoint_at`` entries
+    (see :py:class:`PersistentOrderedDict`).  Set ``background_sync`` to
+    ``True`` to have a background thread write synchronized data, with at most
+    ``max_pending_syncs`` synchronizations waiting to be written.  Set
+    ``load_workers`` and ``write_workers`` to decode files in parallel when
+    loading and to serialize them in parallel when synchronizing.  If
+    ``lazy`` is ``True``, values are only loaded into memory when the file
+    holding them is first accessed, and at most ``max_resident_files`` files
+    are held in memory at once.  Values are written and read by
+    ``serializer``.  If ``cache_records`` is ``True``, serialized entries are
+    kept in memory so that synchronization only serializes dirty values.
+    A tracker's counts need every value, so with ``lazy_decode`` values are
+    still decoded when loaded, but their serialized forms are also kept, as
+    with ``cache_records``.  Set ``dir_levels`` to spread files over nested
+    directories, or set ``storage`` to a storage backend class, such as
+    ``tastypy.SQLiteStorage``, to keep the data somewhere other than files.
+    Set ``compact_keys`` to hold many keys in less memory, as in ``POD``.
     """
 
     _SHARED_TRACKER_STATE = {}
 
+    # Counting done, tried, and aborted entries requires seeing their values
+    _INTERCEPT_VALUES = True
+
     def __init__(
         self, 
         path,
@@ -50,10 +75,39 @@ class ProgressTracker(tastypy.PersistentOrderedDict):
         gzipped=False,
         file_size=tastypy.DEFAULT_FILE_SIZE,
         sync_at=tastypy.DEFAULT_SYNC_AT,
-        clone=True
+        clone=True,
+        mode=None,
+        journal=False,
+        checkpoint_at=tastypy.DEFAULT_CHECKPOINT_AT,
+        background_sync=False,
+        max_pending_syncs=tastypy.DEFAULT_MAX_PENDING_SYNCS,
+        load_workers=1,
+        write_workers=1,
+        lazy=False,
+        max_resident_files=None,
+        serializer=tastypy.JSONSerializer,
+        cache_records=False,
+        lazy_decode=False,
+        sync_every_seconds=None,
+        sync_at_bytes=None,
+        dir_levels=0,
+        file_bytes=None,
+        storage=None,
+        compact_keys=False,
     ):
         super(ProgressTracker, self).__init__(
-            path, init, gzipped, file_size, sync_at, clone)
+            path, mode=mode, init=init, gzipped=gzipped, file_size=file_size,
+            sync_at=sync_at, clone=clone, journal=journal,
+            checkpoint_at=checkpoint_at, background_sync=background_sync,
+            max_pending_syncs=max_pending_syncs, load_workers=load_workers,
+            write_workers=write_workers, lazy=lazy,
+            max_resident_files=max_resident_files, serializer=serializer,
+            cache_records=cache_records, lazy_decode=lazy_decode,
+            sync_every_seconds=sync_every_seconds,
+            sync_at_bytes=sync_at_bytes, dir_levels=dir_levels,
+            file_bytes=file_bytes, storage=storage,
+            compact_keys=compact_keys
+        )
         self.max_tries = max_tries
 
 
@@ -62,9 +116,8 @@ class ProgressTracker(tastypy.PersistentOrderedDict):
     def _get_shared_state(self):
         return self._SHARED_TRACKER_STATE
 
-    def _shared_attrs(self, path, gzipped, file_size):
-        attrs = super(ProgressTracker, self)._shared_attrs(
-            path, gzipped, file_size)
+    def _shared_attrs(self, *args, **kwargs):
+        attrs = super(ProgressTracker, self)._shared_attrs(*args, **kwargs)
         attrs.update({
             '_num_done': 0,
             '_num_tried': 0,
@@ -82,12 +135,44 @@ class ProgressTracker(tastypy.PersistentOrderedDict):
         :py:meth:`add(key) <add()>` is called before attempting to mixin the
         supplied value.  Therefore it is never necessary to provide special
         keys (``'_done'``, ``'_tries'``, ``'_aborted'``) in update dictionaries
-        unless you actually want to mutate those values.
+        unless you actually want to mutate those values.  As with ``POD``,
+        synchronization waits until all the updates have been made, and the
+        numbers of keys added and updated are returned.
         """
-        for key, val in self._iterate_updates(*mappings, **kwargs):
-            if key not in self._values:
-                self.add(key)
-            self[key].update(val)
+        return super(ProgressTracker, self).update(*mappings, **kwargs)
+
+
+    def _update_value(self, key, val, is_new):
+        # Merge the value into the existing one, keeping the counts up to date
+        if is_new:
+            value = self._bulk_value(val)
+        else:
+            value = self._values[key]
+            self._discard_intercept(key, value)
+            value = self._bulk_merge(value, val)
+        key, value = self._read_intercept(key, value)
+        self._values[key] = value
+
+
+    @classmethod
+    def bulk_load(cls, path, items, **options):
+        """
+        Similar to :py:meth:`POD.bulk_load <PersistentOrderedDict.bulk_load>`,
+        but as with :py:meth:`update`, the values should be ``dict``\ s that
+        are used to update the default tracker value.  To add keys with the
+        default value, give empty ``dict``\ s as their values.
+        """
+        return super(ProgressTracker, cls).bulk_load(path, items, **options)
+
+
+    def _bulk_value(self, value):
+        return self._bulk_merge(dict(DEFAULT_PROGRESS_TRACKER_MAPPING), value)
+
+
+    def _bulk_merge(self, value, new_value):
+        merged = dict(value)
+        merged.update(new_value)
+        return merged
 
 
     def _iterate_updates(self, *mappings, **kwargs):
@@ -115,7 +200,7 @@ class ProgressTracker(tastypy.PersistentOrderedDict):
 
         # If the key wasn't already marked aborted, then increment the total
         # number of aborted keys, and mark this key aborted.
-        if not self[key]['_aborted']:
+        if not self._peek(key)['_aborted']:
             self._num_aborted += 1
             self[key]['_aborted'] = True
             self.mark_dirty(key)
@@ -130,7 +215,7 @@ class ProgressTracker(tastypy.PersistentOrderedDict):
 
         # If the key was aborted, then decremet the total number of aborted
         # keys, and update this key to be not aborted.
-        if self[key]['_aborted']:
+        if self._peek(key)['_aborted']:
             self._num_aborted -= 1
             self[key]['_aborted'] = False
             self.mark_dirty(key)
@@ -141,7 +226,7 @@ class ProgressTracker(tastypy.PersistentOrderedDict):
         """
         Returns ``True`` if ``key`` was aborted.
         """
-        return self._values[key]['_aborted']
+        return self._peek(key)['_aborted']
 
 
     def aborted_keys(self):
@@ -149,7 +234,7 @@ class ProgressTracker(tastypy.PersistentOrderedDict):
         Provides an iterator over keys that are marked aborted.  Iteration
         order matches the order in which keys were added.
         """
-        for key in self._keys:
+        for key in self._live_keys():
             aborted = self._values[key]['_aborted']
             if aborted:
                 yield key
@@ -181,7 +266,7 @@ class ProgressTracker(tastypy.PersistentOrderedDict):
         other criteria.
         Iteration order matches the order in which keys were added.
         """
-        for key in self._keys:
+        for key in self._live_keys():
             #val = self._values[key]
             if self.should_do(key, allow_aborted):
                 yield key
@@ -253,7 +338,7 @@ class ProgressTracker(tastypy.PersistentOrderedDict):
         key does not exist, just returns ``False``.
         """
         try:
-            val = self[key]
+            val = self._peek(key)
         except KeyError:
             return False
         else:
@@ -267,7 +352,7 @@ class ProgressTracker(tastypy.PersistentOrderedDict):
         return ``True`` for keys that would otherwise return ``False`` only
         because they are aborted.
         """
-        val = self[key]
+        val = self._peek(key)
         return (
             not val['_done']
             and (self.max_tries < 1 or val['_tries'] < self.max_tries)
@@ -371,6 +456,17 @@ class ProgressTracker(tastypy.PersistentOrderedDict):
         return key, value
 
 
+    def _discard_intercept(self, key, value):
+        # Undo the counting done in ``_read_intercept`` for a value that has
+        # been superseded (e.g. by a journaled value)
+        if value['_done']:
+            self._num_done -= 1
+        if value['_tries'] > 0:
+            self._num_tried -= 1
+        if value['_aborted']:
+            self._num_aborted -= 1
+
+
     def decrement_tries(self, key):
         """
         Decrement the tries counter for ``key``.
@@ -423,8 +519,7 @@ class ProgressTracker(tastypy.PersistentOrderedDict):
         """
         Retrieve the number of times ``key`` has been tried.
         """
-        key = self._ensure_unicode(key)
-        return self[key]['_tries']
+        return self._peek(key)['_tries']
 
 
     def mark_done(self, key):
@@ -435,7 +530,7 @@ class ProgressTracker(tastypy.PersistentOrderedDict):
 
         # If the key wasn't already marked done, then increment the total
         # number of done keys, and update this key to be done
-        if not self[key]['_done']:
+        if not self._peek(key)['_done']:
             self._num_done += 1
             self[key]['_done'] = True
             self.mark_dirty(key)
@@ -450,7 +545,7 @@ class ProgressTracker(tastypy.PersistentOrderedDict):
 
         # If the key was already marked done, then decremet the total
         # number of done keys, and update this key to be not done
-        if self[key]['_done']:
+        if self._peek(key)['_done']:
             self._num_done -= 1
             self[key]['_done'] = False
             self.mark_dirty(key)
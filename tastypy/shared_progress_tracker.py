@@ -67,7 +67,7 @@ def serve_datastructure(datastructure_builder, pipe):
         # Handle signal to shut down the progress tracker server
         if message == SharedProgressTracker.CLOSE:
             is_open = False
-            datastructure.sync()
+            datastructure.close()
             pipe.send('closed')
 
         # Handle remote function calls on the progress tracker
@@ -78,13 +78,17 @@ def serve_datastructure(datastructure_builder, pipe):
             if attr == 'iter':
 
                 # Determine what range of iteration has been requested.
+                # The range skips the gaps left by deleted keys.
                 include_values, start, end = message[1:]
-                keys = datastructure._keys[start:end]
+                keys = [
+                    key for key in datastructure._keys[start:end]
+                    if key is not None
+                ]
 
                 # We need to let the caller know if there are more items
                 # to iterate
                 has_more = True
-                if len(datastructure) <= end:
+                if len(datastructure._keys) <= end:
                     has_more = False
 
                 # Will we return just the keys, or keys and values?
@@ -122,7 +126,8 @@ class SharedPersistentOrderedDict(object):
     LOCK = multiprocessing.RLock()
     PASS_THROUGHS = {
         'update', '_call_deep', 'hold', 'unhold', 'revert', 
-        'mark_dirty', 'sync', 'sync_key'
+        'mark_dirty', 'sync', 'sync_key', 'checkpoint', 'flush',
+        'pending_syncs', 'cache_stats', 'peek', 'pop', 'compact'
     }
     SERVER_DATASTRUCTURE = tastypy.PersistentOrderedDict
 
@@ -133,7 +138,24 @@ class SharedPersistentOrderedDict(object):
             gzipped=False,
             file_size=tastypy.DEFAULT_FILE_SIZE,
             sync_at=tastypy.DEFAULT_SYNC_AT,
-            clone=True
+            clone=True,
+            journal=False,
+            checkpoint_at=tastypy.DEFAULT_CHECKPOINT_AT,
+            background_sync=False,
+            max_pending_syncs=tastypy.DEFAULT_MAX_PENDING_SYNCS,
+            load_workers=1,
+            write_workers=1,
+            lazy=False,
+            max_resident_files=None,
+            serializer=tastypy.JSONSerializer,
+            cache_records=False,
+            lazy_decode=False,
+            sync_every_seconds=None,
+            sync_at_bytes=None,
+            dir_levels=0,
+            file_bytes=None,
+            storage=None,
+            compact_keys=False,
         ):
 
         # Underlying datastructures supporting a shared proxy can't be clones.
@@ -145,7 +167,17 @@ class SharedPersistentOrderedDict(object):
         def build_datastructure():
             return self.SERVER_DATASTRUCTURE(
                 path=path, init=init, gzipped=gzipped, 
-                file_size=file_size, sync_at=sync_at, clone=clone
+                file_size=file_size, sync_at=sync_at, clone=clone,
+                journal=journal, checkpoint_at=checkpoint_at,
+                background_sync=background_sync,
+                max_pending_syncs=max_pending_syncs, load_workers=load_workers,
+                write_workers=write_workers, lazy=lazy,
+                max_resident_files=max_resident_files, serializer=serializer,
+                cache_records=cache_records, lazy_decode=lazy_decode,
+                sync_every_seconds=sync_every_seconds,
+                sync_at_bytes=sync_at_bytes, dir_levels=dir_levels,
+                file_bytes=file_bytes, storage=storage,
+                compact_keys=compact_keys
             )
 
         # Create / start the server, passing it the datastructure-building 
@@ -352,6 +384,8 @@ class SharedPersistentOrderedDict(object):
         return self._passthrough('__contains__', *args, **kwargs)
     def __len__(self, *args, **kwargs):
         return self._passthrough('__len__', *args, **kwargs)
+    def __delitem__(self, *args, **kwargs):
+        return self._passthrough('__delitem__', *args, **kwargs)
 
 
 
@@ -410,7 +444,24 @@ class SharedProgressTracker(SharedPersistentOrderedDict):
         gzipped=False,
         file_size=tastypy.DEFAULT_FILE_SIZE,
         sync_at=tastypy.DEFAULT_SYNC_AT,
-        clone=False
+        clone=False,
+        journal=False,
+        checkpoint_at=tastypy.DEFAULT_CHECKPOINT_AT,
+        background_sync=False,
+        max_pending_syncs=tastypy.DEFAULT_MAX_PENDING_SYNCS,
+        load_workers=1,
+        write_workers=1,
+        lazy=False,
+        max_resident_files=None,
+        serializer=tastypy.JSONSerializer,
+        cache_records=False,
+        lazy_decode=False,
+        sync_every_seconds=None,
+        sync_at_bytes=None,
+        dir_levels=0,
+        file_bytes=None,
+        storage=None,
+        compact_keys=False,
     ):
 
         # Underlying datastructures supporting a shared proxy can't be clones.
@@ -419,7 +470,17 @@ class SharedProgressTracker(SharedPersistentOrderedDict):
         # Delegate to SharedPOD to start up the server.  The datastructure sent
         # to the server is overridden by SERVER_DATASTRUCTURE above.
         super(SharedProgressTracker, self).__init__(
-            path, init, gzipped, file_size, sync_at, clone
+            path, init=init, gzipped=gzipped, file_size=file_size,
+            sync_at=sync_at, clone=clone, journal=journal,
+            checkpoint_at=checkpoint_at, background_sync=background_sync,
+            max_pending_syncs=max_pending_syncs, load_workers=load_workers,
+            write_workers=write_workers, lazy=lazy,
+            max_resident_files=max_resident_files, serializer=serializer,
+            cache_records=cache_records, lazy_decode=lazy_decode,
+            sync_every_seconds=sync_every_seconds,
+            sync_at_bytes=sync_at_bytes, dir_levels=dir_levels,
+            file_bytes=file_bytes, storage=storage,
+            compact_keys=compact_keys
         )
 
         # Remember max_tries locally
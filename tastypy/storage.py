@@ -0,0 +1,113 @@
+"""
+Storage backends keep the data of a ``POD`` somewhere other than its
+directory of numbered files.  A backend is passed to a ``POD`` as a class,
+using the ``storage`` option, and is constructed as
+``storage(path, serializer)``, where ``path`` is the ``POD``'s directory.  It
+provides:
+
+- ``read(keys_only)``, which yields the key and value of every entry, in the
+  order in which the keys were added (values are ``None`` if ``keys_only``
+  is ``True``);
+- ``load(keys)``, which yields the key and value of each of ``keys`` that is
+  stored, in any order;
+- ``write(deleted_keys, items)``, which removes ``deleted_keys``, and then
+  stores the key-value pairs in ``items``, replacing the values of keys
+  already stored and adding the others, in order, after all the stored keys.
+  A write should be atomic;
+- ``close()``, which releases any resources held.
+
+``SQLiteStorage`` keeps entries in a database using the builtin ``sqlite3``
+package.
+"""
+
+import os
+import sqlite3
+
+
+SQLITE_FNAME = 'pod.sqlite'
+
+# At most this many keys are looked up by a single query, which keeps queries
+# within SQLite's limit on the number of parameters
+_MAX_QUERY_KEYS = 500
+
+
+class SQLiteStorage(object):
+    """
+    Keeps the entries of a ``POD`` in a SQLite database in ``path``, as a
+    table of keys and values serialized by ``serializer``.  Each key's rowid
+    records the order in which it was added.  Only the entries that changed
+    are written, and each write is a single transaction, so the database is
+    never left partly written.  The database uses write-ahead logging, so that
+    ``POD``\ s opened in ``'r'`` mode can read it while it is being written.
+    """
+
+    def __init__(self, path, serializer):
+        self._serializer = serializer
+        self._connection = sqlite3.connect(os.path.join(path, SQLITE_FNAME))
+        self._connection.text_factory = str
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'id INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE, '
+                'value TEXT NOT NULL)'
+            )
+
+
+    def read(self, keys_only=False):
+        deserialize_key = self._serializer.deserialize_key
+        if keys_only:
+            for key, in self._connection.execute(
+                'SELECT key FROM entries ORDER BY id'
+            ):
+                yield deserialize_key(key), None
+            return
+
+        deserialize_value = self._serializer.deserialize_value
+        for key, value in self._connection.execute(
+            'SELECT key, value FROM entries ORDER BY id'
+        ):
+            yield deserialize_key(key), deserialize_value(value)
+
+
+    def load(self, keys):
+        serialize_key = self._serializer.serialize_key
+        deserialize_key = self._serializer.deserialize_key
+        deserialize_value = self._serializer.deserialize_value
+        for start in range(0, len(keys), _MAX_QUERY_KEYS):
+            batch = [
+                serialize_key(key)
+                for key in keys[start:start+_MAX_QUERY_KEYS]
+            ]
+            for key, value in self._connection.execute(
+                'SELECT key, value FROM entries WHERE key IN (%s)'
+                % ','.join('?' * len(batch)),
+                batch
+            ):
+                yield deserialize_key(key), deserialize_value(value)
+
+
+    def write(self, deleted_keys, items):
+        # Values of stored keys are updated in place, keeping their rowids,
+        # and the keys that are left are then inserted, in order
+        serialize_key = self._serializer.serialize_key
+        serialize_value = self._serializer.serialize_value
+        rows = [
+            (serialize_value(value), serialize_key(key))
+            for key, value in items
+        ]
+        with self._connection:
+            self._connection.executemany(
+                'DELETE FROM entries WHERE key = ?',
+                [(serialize_key(key),) for key in deleted_keys]
+            )
+            self._connection.executemany(
+                'UPDATE entries SET value = ? WHERE key = ?', rows)
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO entries (value, key) VALUES (?, ?)',
+                rows
+            )
+
+
+    def close(self):
+        self._connection.close()
@@ -1,13 +1,16 @@
 from unittest import main, TestCase
 
 import gzip
+import json
 import sys
 import os
 import time
 import random
 import shutil
+import signal
 import tastypy
 import multiprocessing
+from StringIO import StringIO
 
 # TODO: test gates.
 # TODO: test that max_tries=0 has the expected effects
@@ -34,7 +37,7 @@ def remove_if_exists(path):
 def read_test_files(gzipped=False):
 	entries = {}
 	_open = gzip.open if gzipped else open
-	for path in tastypy.ls(TEST_PATH):
+	for path in tastypy.ls(TEST_PATH, exclude=tastypy.MANIFEST_FNAME):
 		try:
 			f = _open(path)
 			entries.update(tastypy.JSONSerializer.read_items(f))
@@ -256,6 +259,1007 @@ class TestPOD(TestCase):
 		self.assertFalse('b' in my_pod)
 
 
+	def test_update(self):
+		"""
+		Test that ``update()`` synchronizes once, after all updates are made,
+		and reports the numbers of keys added and updated.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		my_pod['0'] = 'old'
+		num_syncs = [0]
+		def sync():
+			num_syncs[0] += 1
+			tastypy.POD.sync(my_pod)
+		my_pod.sync = sync
+
+		num_keys = 2 * tastypy.DEFAULT_SYNC_AT + 10
+		self.assertEqual(
+			my_pod.update((str(i), i) for i in range(num_keys)),
+			(num_keys - 1, 1)
+		)
+		self.assertEqual(num_syncs[0], 1)
+		self.assertEqual(my_pod.dirty(), set())
+		self.assertEqual(read_test_files()['0'], 0)
+
+		# Small updates wait for ``sync_at`` as usual
+		self.assertEqual(my_pod.update({'0': 'new', 'a': 1}), (1, 1))
+		self.assertEqual(my_pod.dirty(), {'0', 'a'})
+		my_pod.sync()
+
+
+	def test_bulk_load(self):
+		"""
+		Test that ``bulk_load()`` writes the same data as ``update()``,
+		including when keys are repeated within and across files.
+		"""
+		items = [(str(i), i) for i in range(2 * tastypy.DEFAULT_FILE_SIZE + 10)]
+		items += [
+			('5', 'later'), ('2005', 'later'), ('a', 'new'), ('5', 'last')]
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		my_pod.update(items)
+		expected_items = my_pod.items()
+
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD.bulk_load(TEST_PATH, iter(items), clone=False)
+		self.assertEqual(my_pod.items(), expected_items)
+		self.assertEqual(my_pod['5'], 'last')
+		new_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		self.assertEqual(new_pod.items(), expected_items)
+
+		with self.assertRaises(ValueError):
+			tastypy.POD.bulk_load(TEST_PATH, items, clone=False)
+
+
+	def test_reshard(self):
+		"""
+		Test that ``reshard()`` copies data into files of a different size and
+		compression, including changes that are only in the journal.
+		"""
+		remove_if_exists(TEST_PATH)
+		new_path = TEST_PATH + '-resharded'
+		remove_if_exists(new_path)
+		my_pod = tastypy.POD(
+			TEST_PATH, 'w', clone=False, file_size=10, journal=True)
+		my_pod.update((str(i), i) for i in range(95))
+		my_pod.checkpoint()
+		my_pod['3'] = 'journaled'
+		my_pod['new'] = 'journaled'
+		del my_pod['4']
+		my_pod.sync()
+
+		tastypy.reshard(
+			TEST_PATH, new_path, file_size=40, gzipped=True, from_file_size=10,
+			workers=2
+		)
+		new_pod = tastypy.POD(
+			new_path, 'r', clone=False, file_size=40, gzipped=True)
+		self.assertEqual(new_pod.items(), my_pod.items())
+		self.assertEqual(len(tastypy.ls(new_path, match='\.gz$')), 3)
+		remove_if_exists(new_path)
+
+
+	def test_dir_levels(self):
+		"""
+		Test that files can be spread over nested directories, and found with
+		or without the manifest.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(
+			TEST_PATH, 'w', clone=False, file_size=2, dir_levels=2)
+		my_pod.update((str(i), i) for i in range(25))
+		my_pod.sync()
+		self.assertEqual(
+			my_pod._path_from_int(1234),
+			os.path.join(my_pod._path, '00', '12', '1234.json')
+		)
+		self.assertTrue(
+			os.path.isfile(os.path.join(TEST_PATH, '00', '00', '12.json')))
+
+		new_pod = tastypy.POD(
+			TEST_PATH, 'r', clone=False, file_size=2, dir_levels=2)
+		self.assertEqual(new_pod.items(), my_pod.items())
+		os.remove(os.path.join(TEST_PATH, tastypy.MANIFEST_FNAME))
+		new_pod = tastypy.POD(
+			TEST_PATH, 'r', clone=False, file_size=2, dir_levels=2)
+		self.assertEqual(new_pod.items(), my_pod.items())
+
+		# A missing file is detected, and the layout must match the manifest
+		my_pod['0'] = -1
+		my_pod.sync()
+		with self.assertRaises(ValueError):
+			tastypy.POD(TEST_PATH, 'r', clone=False, file_size=2)
+		os.remove(os.path.join(TEST_PATH, tastypy.MANIFEST_FNAME))
+		os.remove(my_pod._path_from_int(5))
+		with self.assertRaises(tastypy.PersistentOrderedDictIntegrityError):
+			tastypy.POD(TEST_PATH, 'r', clone=False, file_size=2, dir_levels=2)
+
+
+	def test_file_bytes(self):
+		"""
+		Test that files are split by size if ``file_bytes`` is given, and that
+		``bulk_load()`` splits them the same way.
+		"""
+		items = [(str(i), 'x' * (i % 7) * 10) for i in range(40)]
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(
+			TEST_PATH, 'w', clone=False, file_bytes=100, sync_at=15)
+		for key, value in items:
+			my_pod[key] = value
+		my_pod['41'] = 'x' * 150
+		my_pod.sync()
+		file_paths = tastypy.ls(
+			TEST_PATH, absolute=True, exclude=tastypy.MANIFEST_FNAME)
+		self.assertTrue(len(file_paths) > 1)
+		for path in file_paths:
+			entries = list(tastypy.JSONSerializer.read_items(open(path)))
+			self.assertTrue(
+				os.path.getsize(path) <= 100 or len(entries) == 1)
+		file_data = [open(path).read() for path in file_paths]
+
+		new_pod = tastypy.POD(TEST_PATH, 'w', clone=False, file_bytes=100)
+		self.assertEqual(new_pod.items(), my_pod.items())
+		remove_if_exists(TEST_PATH)
+		tastypy.POD.bulk_load(
+			TEST_PATH, items + [('41', 'x' * 150)], clone=False,
+			file_bytes=100
+		)
+		self.assertEqual(
+			[open(path).read() for path in file_paths], file_data)
+
+
+	def test_sqlite_storage(self):
+		"""
+		Test keeping data in SQLite, including deletions, keys added again
+		after being deleted, and lazy loading.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(
+			TEST_PATH, 'w', clone=False, file_size=3,
+			storage=tastypy.SQLiteStorage
+		)
+		my_pod.update((str(i), {'val': i}) for i in range(10))
+		my_pod[('a', 1)] = [1, 2]
+		my_pod.sync()
+		self.assertEqual(
+			tastypy.ls(TEST_PATH, match='\.json$'), [])
+		del my_pod['3']
+		my_pod['2'] = {'val': -2}
+		del my_pod['5']
+		my_pod['5'] = 'back'
+		my_pod.sync()
+		expected_items = my_pod.items()
+		self.assertEqual(expected_items[-1], ('5', 'back'))
+
+		new_pod = tastypy.POD(
+			TEST_PATH, 'r', clone=False, storage=tastypy.SQLiteStorage)
+		self.assertEqual(new_pod.items(), expected_items)
+		lazy_pod = tastypy.POD(
+			TEST_PATH, 'w', clone=False, file_size=3, lazy=True,
+			max_resident_files=1, storage=tastypy.SQLiteStorage
+		)
+		self.assertEqual(lazy_pod[('a', 1)], [1, 2])
+		lazy_pod['9']['val'] = 90
+		lazy_pod.mark_dirty('9')
+		self.assertEqual(lazy_pod.keys(), new_pod.keys())
+		lazy_pod.sync()
+		new_pod.refresh()
+		self.assertEqual(new_pod['9'], {'val': 90})
+
+		with self.assertRaises(ValueError):
+			tastypy.POD(
+				TEST_PATH, 'r', clone=False, journal=True,
+				storage=tastypy.SQLiteStorage
+			)
+
+		# Closing the POD closes the backend
+		closed = []
+		class ClosingStorage(tastypy.SQLiteStorage):
+			def close(self):
+				closed.append(True)
+				super(ClosingStorage, self).close()
+		with tastypy.POD(
+			TEST_PATH, 'w', clone=False, storage=ClosingStorage
+		) as my_pod:
+			my_pod['a'] = 1
+		my_pod.close()
+		self.assertEqual(closed, [True])
+		new_pod = tastypy.POD(
+			TEST_PATH, 'r', clone=False, storage=tastypy.SQLiteStorage)
+		self.assertEqual(new_pod['a'], 1)
+
+
+	def test_compact_keys(self):
+		"""
+		Test that compact keys are held as ``str`` where possible, and can be
+		looked up, deleted, and reloaded using either kind of string.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(
+			TEST_PATH, 'w', clone=False, file_size=3, compact_keys=True)
+		my_pod.update((u'key%d' % i, i) for i in range(10))
+		my_pod[(u'a', 1)] = 'tuple'
+		my_pod[u'\xe9'] = 'accented'
+		my_pod.sync()
+		self.assertEqual(
+			[type(key) for key in my_pod.keys()[:2]], [str, str])
+		self.assertEqual(my_pod.keys()[-2:], [('a', 1), u'\xe9'])
+		self.assertTrue(isinstance(my_pod.keys()[-2][0], str))
+		self.assertTrue(isinstance(my_pod.keys()[-1], unicode))
+		del my_pod[u'key3']
+		del my_pod['key4']
+		my_pod['key5'] = 50
+		self.assertEqual(my_pod[u'key5'], 50)
+		self.assertFalse('key3' in my_pod)
+		my_pod.sync()
+
+		for options in [{}, {'lazy': True}, {'compact_keys': True}]:
+			new_pod = tastypy.POD(TEST_PATH, 'r', clone=False, **options)
+			self.assertEqual(new_pod.items(), my_pod.items())
+			self.assertEqual(new_pod[(u'a', 1)], 'tuple')
+
+
+	def test_mapped_pod(self):
+		"""
+		Test reading data through ``MappedPOD``, and that its index is
+		rebuilt when the data changes.
+		"""
+		for serializer in [tastypy.JSONSerializer, tastypy.BinarySerializer]:
+			remove_if_exists(TEST_PATH)
+			my_pod = tastypy.POD(
+				TEST_PATH, 'w', clone=False, file_size=10,
+				serializer=serializer
+			)
+			my_pod.update((str(i), {'i': i}) for i in range(25))
+			my_pod[('a', 1)] = u'\u03bb'
+			my_pod[7] = None
+			my_pod.sync()
+
+			mapped_pod = tastypy.MappedPOD(TEST_PATH, serializer=serializer)
+			self.assertEqual(len(mapped_pod), 27)
+			self.assertEqual(mapped_pod.items(), my_pod.items())
+			self.assertEqual(mapped_pod['3'], {'i': 3})
+			self.assertEqual(mapped_pod[('a', 1)], u'\u03bb')
+			self.assertTrue(7 in mapped_pod)
+			self.assertFalse('missing' in mapped_pod)
+			self.assertEqual(mapped_pod.get('missing', 0), 0)
+			with self.assertRaises(KeyError):
+				mapped_pod['missing']
+			mapped_pod.close()
+
+		index_path = os.path.join(TEST_PATH, tastypy.INDEX_FNAME)
+		index_mtime = os.path.getmtime(index_path)
+		self.assertEqual(tastypy.MappedPOD(
+			TEST_PATH, serializer=serializer)['24'], {'i': 24})
+		self.assertEqual(os.path.getmtime(index_path), index_mtime)
+		my_pod['new'] = 1
+		my_pod.sync()
+		self.assertEqual(tastypy.MappedPOD(
+			TEST_PATH, serializer=serializer)['new'], 1)
+
+		with self.assertRaises(ValueError):
+			tastypy.MappedPOD(TEST_PATH)
+
+
+	def test_delete(self):
+		"""
+		Test that deleted keys are removed from disk, in journal mode too, and
+		that ``compact()`` merges part-empty files and renumbers the rest.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(TEST_PATH, 'w', clone=False, file_size=10)
+		my_pod.update((str(i), i) for i in range(35))
+		for i in range(5, 25):
+			del my_pod[str(i)]
+		self.assertEqual(my_pod.pop('25'), 25)
+		self.assertEqual(my_pod.pop('25', None), None)
+		with self.assertRaises(KeyError):
+			del my_pod['25']
+		expected_items = [(str(i), i) for i in range(5) + range(26, 35)]
+		self.assertEqual(my_pod.items(), expected_items)
+		self.assertEqual(len(my_pod), 14)
+		my_pod.sync()
+		self.assertEqual(
+			tastypy.POD(TEST_PATH, 'r', clone=False).items(), expected_items)
+
+		# File 1 is empty and file 2 holds 4 keys, so each is merged into file 0
+		self.assertEqual(my_pod.compact(max_files=1), 0)
+		my_pod['new'] = 'value'
+		my_pod.sync()
+		self.assertEqual(len(read_test_files()), 15)
+		self.assertFalse(os.path.exists(my_pod._path_from_int(2)))
+		new_pod = tastypy.POD(TEST_PATH, 'r', clone=False)
+		self.assertEqual(new_pod.items(), expected_items + [('new', 'value')])
+
+		# Deletions are journaled as tombstones, and replayed in order
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(TEST_PATH, 'w', clone=False, journal=True)
+		my_pod.update([('a', 1), ('b', 2), ('c', 3)])
+		my_pod.checkpoint()
+		del my_pod['a']
+		my_pod['a'] = 4
+		del my_pod['b']
+		my_pod.sync()
+		self.assertEqual(
+			list(tastypy.JSONSerializer.read_items(
+				open(my_pod._path_from_int(0)))),
+			[('a', 1), ('b', 2), ('c', 3)]
+		)
+		new_pod = tastypy.POD(TEST_PATH, 'w', clone=False, journal=True)
+		self.assertEqual(new_pod.items(), [('c', 3), ('a', 4)])
+
+
+	def test_interrupted_compaction(self):
+		"""
+		Test that a compaction interrupted after any of its writes is finished
+		when the data is next opened for writing, losing no keys.
+		"""
+		snapshot_path = TEST_PATH + '-snapshot'
+		write_files = tastypy._background_writer.write_files
+
+		# Merges in the middle and at the end, and removal of empty files
+		for deleted in [
+			range(4, 7) + range(8, 11), range(13, 19), range(12, 20)
+		]:
+			remove_if_exists(TEST_PATH)
+			my_pod = tastypy.POD(TEST_PATH, 'w', clone=False, file_size=4)
+			my_pod.update((str(i), i) for i in range(20))
+			for i in deleted:
+				del my_pod[str(i)]
+			my_pod.sync()
+			expected_items = my_pod.items()
+
+			# Capture the compaction's writes instead of carrying them out
+			batches = []
+			my_pod._commit = batches.append
+			my_pod.compact(max_files=1)
+			for writes in batches[:-1]:
+				write_files(writes)
+			remove_if_exists(snapshot_path)
+			shutil.copytree(TEST_PATH, snapshot_path)
+
+			compaction = batches[-1]
+			for num_writes in range(len(compaction) + 1):
+				remove_if_exists(TEST_PATH)
+				shutil.copytree(snapshot_path, TEST_PATH)
+				write_files(compaction[:num_writes])
+				if 3 <= num_writes < len(compaction) - 1:
+					with self.assertRaises(
+						tastypy.PersistentOrderedDictIntegrityError
+					):
+						tastypy.POD(TEST_PATH, 'r', clone=False)
+				new_pod = tastypy.POD(
+					TEST_PATH, 'w', clone=False, file_size=4)
+				self.assertEqual(new_pod.items(), expected_items)
+				self.assertFalse(os.path.exists(os.path.join(
+					TEST_PATH, tastypy.COMPACTION_PLAN_FNAME)))
+				new_pod.compact()
+				new_pod.close()
+				self.assertEqual(
+					tastypy.POD(TEST_PATH, 'r', clone=False).items(),
+					expected_items
+				)
+
+		remove_if_exists(snapshot_path)
+
+
+	def test_sync_policies(self):
+		"""
+		Test synchronization triggered by the age of the oldest
+		unsynchronized change, and by the estimated size of dirty values.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(
+			TEST_PATH, 'w', clone=False, sync_every_seconds=0.05)
+		my_pod['a'] = 1
+		my_pod['b'] = 2
+		self.assertEqual(my_pod.dirty(), {'a', 'b'})
+		time.sleep(0.1)
+		my_pod['c'] = 3
+		self.assertEqual(my_pod.dirty(), set())
+		self.assertEqual(read_test_files(), {'a': 1, 'b': 2, 'c': 3})
+
+		# Pending deletions age like dirty values
+		del my_pod['a']
+		time.sleep(0.1)
+		del my_pod['b']
+		self.assertEqual(read_test_files(), {'c': 3})
+
+		# Entries in the files are 6 bytes long
+		my_pod = tastypy.POD(TEST_PATH, 'w', clone=False, sync_at_bytes=30)
+		for i in range(4):
+			my_pod[str(i)] = 4
+		self.assertEqual(len(my_pod.dirty()), 4)
+		my_pod['4'] = 4
+		self.assertEqual(my_pod.dirty(), set())
+
+		with self.assertRaises(ValueError):
+			tastypy.POD(TEST_PATH, 'w', clone=False, sync_at_bytes=0)
+
+		# Sizes are estimated before compression, even when files are
+		# compressed in parallel
+		remove_if_exists(TEST_PATH)
+		with tastypy.POD(
+			TEST_PATH, 'w', clone=False, gzipped=True, write_workers=2
+		) as my_pod:
+			my_pod.hold()
+			for i in range(2 * tastypy.DEFAULT_FILE_SIZE):
+				my_pod[str(i)] = 'x' * 1000
+			my_pod.sync()
+			self.assertGreater(my_pod._sync_state['record_size'], 1000)
+
+
+	def test_journal(self):
+		"""
+		Test that in journal mode, synchronization appends to the journal
+		instead of rewriting files, that the journal is replayed on load, and
+		that checkpointing folds the journal into the files.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(TEST_PATH, 'w', clone=False, journal=True)
+		my_pod.hold()
+		for i in range(2 * tastypy.DEFAULT_FILE_SIZE):
+			my_pod[str(i)] = i
+		my_pod.sync()
+
+		# Only the journal was written
+		journal_path = os.path.join(TEST_PATH, tastypy.JOURNAL_FNAME)
+		self.assertTrue(os.path.exists(journal_path))
+		self.assertFalse(os.path.exists(my_pod._path_from_int(0)))
+
+		# Changing an existing key appends to the journal.  A partially
+		# written entry at the end of the journal is ignored on replay.
+		my_pod['3'] = 'three'
+		my_pod.sync()
+		open(journal_path, 'a').write('"4"\t"partial')
+
+		# The journal is replayed when the data is read
+		other_pod = tastypy.POD(TEST_PATH, 'w', clone=False, journal=True)
+		self.assertEqual(len(other_pod), 2 * tastypy.DEFAULT_FILE_SIZE)
+		self.assertEqual(other_pod.keys(), my_pod.keys())
+		self.assertEqual(other_pod['3'], 'three')
+		self.assertEqual(other_pod['4'], 4)
+
+		# Checkpointing writes the files and removes the journal
+		other_pod.checkpoint()
+		self.assertFalse(os.path.exists(journal_path))
+		entries = read_test_files()
+		self.assertEqual(entries['3'], 'three')
+		self.assertEqual(len(entries), 2 * tastypy.DEFAULT_FILE_SIZE)
+
+		# The journal is checkpointed automatically at ``checkpoint_at``
+		my_pod = tastypy.POD(
+			TEST_PATH, 'w', clone=False, journal=True, checkpoint_at=2)
+		my_pod['0'] = 'zero'
+		my_pod.sync()
+		self.assertTrue(os.path.exists(journal_path))
+		my_pod['1'] = 'one'
+		my_pod.sync()
+		self.assertFalse(os.path.exists(journal_path))
+		entries = read_test_files()
+		self.assertEqual(entries['0'], 'zero')
+		self.assertEqual(entries['1'], 'one')
+
+
+	def test_background_sync(self):
+		"""
+		Test that in background_sync mode, synchronization writes a snapshot of
+		the data on the writer thread, and that flush() waits for it.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(
+			TEST_PATH, 'w', clone=False, background_sync=True)
+		my_pod['a'] = [1]
+		my_pod.sync()
+
+		# Changes made after synchronization aren't part of the snapshot
+		my_pod['a'].append(2)
+		my_pod._writer.wait()
+		entries = read_test_files()
+		self.assertEqual(entries['a'], [1])
+
+		# Flushing synchronizes, and waits for everything to be written
+		my_pod.flush()
+		self.assertEqual(my_pod.pending_syncs(), 0)
+		entries = read_test_files()
+		self.assertEqual(entries['a'], [1, 2])
+
+		# Automatic synchronization also happens on the writer thread
+		for i in range(tastypy.DEFAULT_SYNC_AT):
+			my_pod[str(i)] = i
+		my_pod._writer.wait()
+		entries = read_test_files()
+		self.assertEqual(len(entries), tastypy.DEFAULT_SYNC_AT + 1)
+
+
+	def test_load_workers(self):
+		"""
+		Test that loading files in parallel yields the same data, in the same
+		order, and still detects corrupted files.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		my_pod.hold()
+		for i in range(3 * tastypy.DEFAULT_FILE_SIZE + 10):
+			my_pod[str(i)] = {'val': i}
+		my_pod.sync()
+
+		# The workers are forked without the open POD's SIGTERM handler
+		worker_handlers = []
+		pool_class = multiprocessing.Pool
+		def record_handler(*args, **kwargs):
+			worker_handlers.append(signal.getsignal(signal.SIGTERM))
+			return pool_class(*args, **kwargs)
+		multiprocessing.Pool = record_handler
+		try:
+			other_pod = tastypy.POD(
+				TEST_PATH, 'w', clone=False, load_workers=3)
+		finally:
+			multiprocessing.Pool = pool_class
+		self.assertEqual(other_pod.items(), my_pod.items())
+		self.assertEqual(worker_handlers, [signal.SIG_DFL])
+
+		# Mangle one of the lines in the middle of the second file
+		stored_data_str = open(my_pod._path_from_int(1)).read().split('\n')
+		stored_data_str[500] = 'bad format'
+		open(my_pod._path_from_int(1), 'w').write('\n'.join(stored_data_str))
+		with self.assertRaises(tastypy.PersistentOrderedDictIntegrityError):
+			tastypy.POD(TEST_PATH, 'w', clone=False, load_workers=3)
+
+
+	def test_write_workers(self):
+		"""
+		Test that files serialized in parallel can be read back, whether or
+		not they are gzipped.
+		"""
+		for gzipped in (False, True):
+			remove_if_exists(TEST_PATH)
+			my_pod = tastypy.POD(
+				TEST_PATH, 'w', clone=False, gzipped=gzipped, write_workers=2)
+			my_pod.hold()
+			for i in range(3 * tastypy.DEFAULT_FILE_SIZE + 10):
+				my_pod[str(i)] = {'val': i}
+			my_pod.sync()
+
+			entries = read_test_files(gzipped)
+			self.assertEqual(len(entries), 3 * tastypy.DEFAULT_FILE_SIZE + 10)
+			self.assertEqual(entries['1234'], {'val': 1234})
+
+			other_pod = tastypy.POD(
+				TEST_PATH, 'w', clone=False, gzipped=gzipped)
+			self.assertEqual(other_pod.items(), my_pod.items())
+
+
+	def test_lazy(self):
+		"""
+		Test that in lazy mode, values are only loaded from the files holding
+		keys that are accessed, and that the POD otherwise behaves normally.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		my_pod.hold()
+		for i in range(3 * tastypy.DEFAULT_FILE_SIZE + 10):
+			my_pod[str(i)] = {'val': i}
+		my_pod.sync()
+
+		# Only keys are loaded initially
+		lazy_pod = tastypy.POD(TEST_PATH, 'w', clone=False, lazy=True)
+		self.assertEqual(len(lazy_pod), 3 * tastypy.DEFAULT_FILE_SIZE + 10)
+		self.assertEqual(len(lazy_pod._values), 0)
+		self.assertTrue('1500' in lazy_pod)
+
+		# Accessing a key loads the values in its file
+		self.assertEqual(lazy_pod['1500'], {'val': 1500})
+		self.assertEqual(list(lazy_pod._values.loaded), [1])
+		self.assertEqual(len(lazy_pod._values), tastypy.DEFAULT_FILE_SIZE)
+		with self.assertRaises(KeyError):
+			lazy_pod['missing']
+
+		# Values set before their file is loaded aren't overwritten by loading
+		lazy_pod['2500'] = 'new'
+		lazy_pod['new-key'] = 'new'
+		self.assertEqual(lazy_pod['2501'], {'val': 2501})
+		self.assertEqual(lazy_pod['2500'], 'new')
+
+		# Synchronization writes complete files, and iteration is unchanged
+		lazy_pod.sync()
+		my_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		self.assertEqual(my_pod['2500'], 'new')
+		self.assertEqual(my_pod['new-key'], 'new')
+		self.assertEqual(my_pod['2600'], {'val': 2600})
+		self.assertEqual(lazy_pod.items(), my_pod.items())
+
+		# Replaying a journal doesn't load the files of the keys it holds
+		journal_pod = tastypy.POD(TEST_PATH, 'w', clone=False, journal=True)
+		journal_pod['5'] = 'journaled'
+		del journal_pod['1006']
+		journal_pod.sync()
+		lazy_pod = tastypy.POD(TEST_PATH, 'r', clone=False, lazy=True)
+		self.assertEqual(len(lazy_pod._values.loaded), 0)
+		self.assertEqual(lazy_pod['5'], 'journaled')
+		self.assertFalse('1006' in lazy_pod)
+		self.assertEqual(lazy_pod.cache_stats()['misses'], 0)
+
+
+	def test_max_resident_files(self):
+		"""
+		Test that in lazy mode, at most ``max_resident_files`` files are held
+		in memory, that the least recently used files are dropped first, and
+		that files with unwritten values are written before being dropped.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		my_pod.hold()
+		for i in range(4 * tastypy.DEFAULT_FILE_SIZE):
+			my_pod[str(i)] = i
+		my_pod.sync()
+
+		lazy_pod = tastypy.POD(
+			TEST_PATH, 'w', clone=False, lazy=True, max_resident_files=2)
+		self.assertEqual(lazy_pod.values(), range(4 * tastypy.DEFAULT_FILE_SIZE))
+		self.assertEqual(lazy_pod.cache_stats(), {
+			'hits': 0, 'misses': 4,
+			'evictions': 2, 'resident_files': 2
+		})
+		self.assertEqual(
+			dict.__len__(lazy_pod._values), 2 * tastypy.DEFAULT_FILE_SIZE)
+
+		# Recently used files are kept.  Returning to a file that is still
+		# held counts as a hit.
+		lazy_pod._values['2000']
+		lazy_pod._values['1000']
+		self.assertEqual(list(lazy_pod._values.loaded), [2, 1])
+		self.assertEqual(lazy_pod.cache_stats()['hits'], 1)
+		self.assertEqual(lazy_pod.cache_stats()['misses'], 5)
+
+		# Files holding dirty values can't be dropped, so they are written as
+		# soon as there are too many of them
+		lazy_pod['1001'] = 'a'
+		lazy_pod['2001'] = 'b'
+		self.assertEqual(lazy_pod['1'], 1)
+		self.assertEqual(lazy_pod.cache_stats()['resident_files'], 3)
+		lazy_pod['1'] = 'c'
+		self.assertEqual(lazy_pod.cache_stats()['resident_files'], 2)
+		self.assertEqual(
+			dict.__len__(lazy_pod._values), 2 * tastypy.DEFAULT_FILE_SIZE)
+		entries = read_test_files()
+		self.assertEqual(
+			[entries['1001'], entries['2001'], entries['1']], ['a', 'b', 'c'])
+		self.assertEqual(lazy_pod['1001'], 'a')
+		self.assertEqual(lazy_pod['2001'], 'b')
+		lazy_pod.sync()
+
+		# On hold, files whose values were only looked up are still dropped,
+		# but files with changed values are kept until they can be written
+		lazy_pod = tastypy.POD(
+			TEST_PATH, 'w', clone=False, lazy=True, max_resident_files=2)
+		lazy_pod.hold()
+		peak = 0
+		for i in range(4 * tastypy.DEFAULT_FILE_SIZE):
+			lazy_pod[str(i)]
+			peak = max(peak, dict.__len__(lazy_pod._values))
+		self.assertEqual(peak, 2 * tastypy.DEFAULT_FILE_SIZE)
+		for i in range(0, 4 * tastypy.DEFAULT_FILE_SIZE, 1000):
+			self.assertEqual(lazy_pod[str(i)], i)
+			lazy_pod[str(i)] = 'changed'
+		self.assertEqual(lazy_pod.cache_stats()['resident_files'], 4)
+		lazy_pod.unhold()
+		self.assertEqual(lazy_pod.cache_stats()['resident_files'], 2)
+		self.assertEqual(read_test_files()['3000'], 'changed')
+
+
+	def test_manifest(self):
+		"""
+		Test that data is loaded using the manifest, that files added after
+		the manifest are still found, and that files are checked against the
+		manifest, including files left part-empty by deletions.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		my_pod.hold()
+		for i in range(2 * tastypy.DEFAULT_FILE_SIZE + 10):
+			my_pod[str(i)] = i
+		my_pod.sync()
+		manifest_path = os.path.join(TEST_PATH, tastypy.MANIFEST_FNAME)
+		manifest = json.load(open(manifest_path))
+		self.assertEqual(
+			[entry[0] for entry in manifest['files']],
+			[tastypy.DEFAULT_FILE_SIZE, tastypy.DEFAULT_FILE_SIZE, 10]
+		)
+		new_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		self.assertEqual(new_pod.items(), my_pod.items())
+
+		# Synchronizations append the entries of the files they rewrite, until
+		# more has been appended than the manifest lists
+		new_pod['5'] = -5
+		new_pod.sync()
+		lines = open(manifest_path).read().splitlines()
+		self.assertEqual(len(lines), 3)
+		self.assertEqual(json.loads(lines[0]), manifest)
+		self.assertEqual(tastypy.POD(TEST_PATH, 'r', clone=False)['5'], -5)
+		for value in [0, 1, 5]:
+			new_pod['5'] = value
+			new_pod.sync()
+		lines = open(manifest_path).read().splitlines()
+		self.assertEqual([json.loads(line) for line in lines], [manifest])
+
+		# A file added after the manifest was written is still found
+		open(os.path.join(TEST_PATH, '3.json'), 'w').write('"a"\t1\n')
+		open(manifest_path, 'w').write(json.dumps(manifest))
+		self.assertEqual(tastypy.POD(TEST_PATH, 'r', clone=False)['a'], 1)
+		os.remove(os.path.join(TEST_PATH, '3.json'))
+
+		# Files whose number of entries doesn't match the manifest are
+		# detected even if their size matches
+		manifest['files'][2][0] = 9
+		open(manifest_path, 'w').write(json.dumps(manifest))
+		with self.assertRaises(tastypy.PersistentOrderedDictIntegrityError):
+			tastypy.POD(TEST_PATH, 'w', clone=False)
+
+		# Without a manifest, the files are found by listing the directory
+		os.remove(manifest_path)
+		new_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		self.assertEqual(new_pod.items(), my_pod.items())
+
+		# Files whose size doesn't match the manifest are corrupt, even if
+		# deleting keys could have left them part-empty
+		del new_pod['5']
+		new_pod.sync()
+		file_path = os.path.join(TEST_PATH, '0.json')
+		lines = open(file_path).readlines()
+		open(file_path, 'w').writelines(lines[:10] + lines[11:])
+		with self.assertRaises(tastypy.PersistentOrderedDictIntegrityError):
+			tastypy.POD(TEST_PATH, 'r', clone=False)
+
+
+	def test_close(self):
+		"""
+		Test that closing a POD synchronizes it and stops its worker
+		processes, which are also stopped if loading fails.
+		"""
+		remove_if_exists(TEST_PATH)
+		with tastypy.POD(
+			TEST_PATH, 'w', clone=False, write_workers=2
+		) as my_pod:
+			workers = list(my_pod._write_pool._pool)
+			my_pod['a'] = 1
+		self.assertFalse(any(worker.is_alive() for worker in workers))
+		self.assertEqual(tastypy.POD(TEST_PATH, 'r', clone=False)['a'], 1)
+
+		open(os.path.join(TEST_PATH, '0.json'), 'a').write('"b"\t2\n')
+		num_children = len(multiprocessing.active_children())
+		with self.assertRaises(tastypy.PersistentOrderedDictIntegrityError):
+			tastypy.POD(TEST_PATH, 'w', write_workers=2)
+		self.assertEqual(len(multiprocessing.active_children()), num_children)
+		self.assertFalse(
+			tastypy.normalize_path(TEST_PATH) in tastypy.POD._SHARED_POD_STATE)
+
+		# Workers are forked with the default SIGTERM handler, rather than the
+		# handler of the open POD, which is restored afterwards
+		handler = signal.getsignal(signal.SIGTERM)
+		self.assertNotEqual(handler, signal.SIG_DFL)
+		worker_handlers = []
+		pool_class = multiprocessing.Pool
+		def record_handler(*args, **kwargs):
+			worker_handlers.append(signal.getsignal(signal.SIGTERM))
+			return pool_class(*args, **kwargs)
+		multiprocessing.Pool = record_handler
+		try:
+			pool = tastypy.persistent_ordered_dict._worker_pool(2)
+		finally:
+			multiprocessing.Pool = pool_class
+		pool.terminate()
+		pool.join()
+		self.assertEqual(worker_handlers, [signal.SIG_DFL])
+		self.assertEqual(signal.getsignal(signal.SIGTERM), handler)
+
+
+	def test_peek(self):
+		"""
+		Test that peeking at values gives copies, and doesn't mark keys dirty.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		my_pod['a'] = {'val': [1]}
+		my_pod.sync()
+
+		value = my_pod.peek('a')
+		self.assertEqual(value, {'val': [1]})
+		self.assertEqual(my_pod.dirty(), set())
+		value['val'].append(2)
+		self.assertEqual(my_pod.peek('a'), {'val': [1]})
+		with self.assertRaises(KeyError):
+			my_pod.peek('missing')
+
+
+	def test_skip_unchanged_files(self):
+		"""
+		Test that synchronizing doesn't rewrite files whose contents haven't
+		changed, even though the keys in them were accessed.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		my_pod.hold()
+		for i in range(2 * tastypy.DEFAULT_FILE_SIZE):
+			my_pod[str(i)] = {'val': i}
+		my_pod.sync()
+
+		# Make the files look old, so that rewriting them would be noticed
+		paths = [os.path.join(TEST_PATH, '%d.json' % i) for i in range(2)]
+		for path in paths:
+			os.utime(path, (0, 0))
+
+		# Only the file whose contents changed is rewritten
+		my_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		my_pod['1']
+		my_pod['1500']['val'] = 'changed'
+		self.assertEqual(len(my_pod.dirty()), 2)
+		my_pod.sync()
+		self.assertEqual(os.path.getmtime(paths[0]), 0)
+		self.assertNotEqual(os.path.getmtime(paths[1]), 0)
+		new_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		self.assertEqual(new_pod['1500'], {'val': 'changed'})
+
+
+	def test_cache_records(self):
+		"""
+		Test that when records are cached, synchronization only serializes
+		dirty values, including when loaded from files and the journal.
+		"""
+		class CountingSerializer(tastypy.JSONSerializer):
+			num_dumped = 0
+			@classmethod
+			def dump_items(cls, items):
+				for record in super(CountingSerializer, cls).dump_items(items):
+					cls.num_dumped += 1
+					yield record
+
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(
+			TEST_PATH, 'w', clone=False, journal=True, cache_records=True,
+			serializer=CountingSerializer
+		)
+		my_pod.hold()
+		for i in range(2 * tastypy.DEFAULT_FILE_SIZE):
+			my_pod[str(i)] = {'val': i}
+		my_pod.checkpoint()
+		my_pod['1'] = 'journaled'
+		my_pod.sync()
+
+		# Only the dirty values are serialized by a checkpoint
+		my_pod = tastypy.POD(
+			TEST_PATH, 'w', clone=False, journal=True, cache_records=True,
+			serializer=CountingSerializer
+		)
+		CountingSerializer.num_dumped = 0
+		my_pod['2']['val'] = 'changed'
+		my_pod['1500']['val'] = 'changed'
+		my_pod.checkpoint()
+		self.assertEqual(CountingSerializer.num_dumped, 2)
+
+		new_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		self.assertEqual(new_pod.items(), my_pod.items())
+		self.assertEqual(new_pod['1'], 'journaled')
+
+		with self.assertRaises(ValueError):
+			tastypy.POD(
+				TEST_PATH, 'w', clone=False, lazy=True, max_resident_files=1,
+				cache_records=True
+			)
+
+
+	def test_lazy_decode(self):
+		"""
+		Test that with ``lazy_decode``, values are decoded when first
+		accessed, and values never decoded are written back unchanged.
+		"""
+		for serializer in [tastypy.JSONSerializer, tastypy.BinarySerializer]:
+			remove_if_exists(TEST_PATH)
+			my_pod = tastypy.POD(
+				TEST_PATH, 'w', clone=False, serializer=serializer)
+			my_pod.hold()
+			for i in range(tastypy.DEFAULT_FILE_SIZE + 10):
+				my_pod[str(i)] = {'val': [i]}
+			my_pod.sync()
+
+			lazy_pod = tastypy.POD(
+				TEST_PATH, 'w', clone=False, serializer=serializer,
+				lazy_decode=True
+			)
+			self.assertEqual(len(lazy_pod), tastypy.DEFAULT_FILE_SIZE + 10)
+			self.assertEqual(dict(lazy_pod._values), {})
+			self.assertEqual(lazy_pod.peek('5'), {'val': [5]})
+			lazy_pod['6']['val'].append('changed')
+			self.assertEqual(dict(lazy_pod._values), {
+				'5': {'val': [5]}, '6': {'val': [6, 'changed']}})
+			lazy_pod.sync()
+
+			new_pod = tastypy.POD(
+				TEST_PATH, 'w', clone=False, serializer=serializer)
+			self.assertEqual(new_pod['6'], {'val': [6, 'changed']})
+			self.assertEqual(lazy_pod.items(), new_pod.items())
+
+		with self.assertRaises(ValueError):
+			tastypy.POD(TEST_PATH, 'w', clone=False, lazy=True, lazy_decode=True)
+
+
+	def test_serializer(self):
+		"""
+		Test that files written by one serializer can be read by another
+		serializer of the same format, that the serializer is recorded in the
+		manifest, and that files of another format are refused.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_pod = tastypy.POD(
+			TEST_PATH, 'w', clone=False,
+			serializer=tastypy.FastJSONSerializer
+		)
+		my_pod[u'\u00e9\t\\t'] = {'a': [1, 2.5, None]}
+		my_pod[('x', (u'\u00e9', 1))] = 'tuple'
+		my_pod.sync()
+		manifest = json.load(
+			open(os.path.join(TEST_PATH, tastypy.MANIFEST_FNAME)))
+		self.assertEqual(manifest['serializer'], 'fast-json')
+
+		new_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		self.assertEqual(new_pod.items(), my_pod.items())
+		self.assertEqual(new_pod[('x', (u'\u00e9', 1))], 'tuple')
+
+		class OtherSerializer(tastypy.JSONSerializer):
+			name = 'other'
+			format = 'other'
+		with self.assertRaises(ValueError):
+			tastypy.POD(TEST_PATH, 'w', clone=False, serializer=OtherSerializer)
+
+
+	def test_binary_serializer(self):
+		"""
+		Test converting data to the binary format, and that binary files can
+		be read, including from a journal whose last record is truncated.
+		"""
+		binary_path = TEST_PATH + '-binary'
+		remove_if_exists(TEST_PATH)
+		remove_if_exists(binary_path)
+		my_pod = tastypy.POD(TEST_PATH, 'w', clone=False)
+		my_pod.hold()
+		for i in range(tastypy.DEFAULT_FILE_SIZE + 10):
+			my_pod[str(i)] = {'val': [i, str(i)]}
+		my_pod[('a\t', u'\u00e9\\')] = 'tuple'
+		my_pod.sync()
+
+		tastypy.convert(TEST_PATH, binary_path)
+		self.assertTrue(os.path.exists(os.path.join(binary_path, '1.bin')))
+		self.assertTrue(
+			open(os.path.join(binary_path, '0.bin')).read().startswith(
+				tastypy.BinarySerializer.header))
+		self.assertLess(
+			os.path.getsize(os.path.join(binary_path, '0.bin')),
+			os.path.getsize(os.path.join(TEST_PATH, '0.json'))
+		)
+		binary_pod = tastypy.POD(
+			binary_path, 'w', clone=False, journal=True,
+			serializer=tastypy.BinarySerializer
+		)
+		self.assertEqual(binary_pod.items(), my_pod.items())
+
+		# Journaled records are replayed, except a truncated last record
+		binary_pod['0'] = 'journaled'
+		binary_pod['new'] = 'journaled'
+		binary_pod.sync()
+		journal_path = os.path.join(binary_path, tastypy.JOURNAL_FNAME)
+		open(journal_path, 'ab').write(
+			''.join(tastypy.BinarySerializer.dump_items([('1', 1)]))[:-1])
+		binary_pod = tastypy.POD(
+			binary_path, 'w', clone=False, journal=True,
+			serializer=tastypy.BinarySerializer
+		)
+		self.assertEqual(binary_pod['0'], 'journaled')
+		self.assertEqual(binary_pod['1'], {'val': [1, '1']})
+		self.assertEqual(binary_pod.keys()[-1], 'new')
+		binary_pod.sync()
+		remove_if_exists(binary_path)
+
 
 class TestTracker(TestCase):
 
@@ -339,6 +1343,20 @@ class TestTracker(TestCase):
 		)
 
 
+	def test_positional_args(self):
+		# ``max_tries`` and ``init`` keep their positions after ``path``, so
+		# that existing callers passing them positionally are unaffected.
+		remove_if_exists(TEST_PATH)
+		my_tracker = tastypy.Tracker(TEST_PATH, 3, [('a', {})], clone=False)
+		self.assertEqual(my_tracker.max_tries, 3)
+		self.assertEqual(list(my_tracker.keys()), ['a'])
+		my_tracker.close()
+
+		tracker = tastypy.SharedProgressTracker(TEST_PATH, 3)
+		self.assertEqual(tracker.max_tries, 3)
+		tracker.close()
+
+
 	def test_update(self):
 		# Test tries status
 		remove_if_exists(TEST_PATH)
@@ -346,7 +1364,7 @@ class TestTracker(TestCase):
 
 		my_tracker.add('a')
 		my_tracker['a']['foo'] = 1
-		my_tracker.update(
+		num_added, num_updated = my_tracker.update(
 			{
 				'a': {'foo': 2, 'bar': [3], 'beep': 'x'},
 				'b': {'_tries':1, 'fizz': 'baz'}
@@ -354,6 +1372,8 @@ class TestTracker(TestCase):
 			(('a', {'beep':'xx', 'boo':42}),),
 			c={'bam':[89]}
 		)
+		self.assertEqual((num_added, num_updated), (2, 1))
+		self.assertEqual(my_tracker.num_tried(), 1)
 
 		my_tracker.sync()
 		entries = read_test_files()
@@ -414,6 +1434,377 @@ class TestTracker(TestCase):
 		self.assertEqual(my_tracker.percent_done(), '100.00 %')
 
 
+	def test_journal_counts(self):
+		"""
+		Test that counters remain correct when journaled values replace the
+		values read from file.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_tracker = tastypy.Tracker(TEST_PATH, mode='w', clone=False)
+		my_tracker.add_many(['a', 'b', 'c'])
+		my_tracker.mark_done('a')
+		my_tracker.sync()
+
+		my_tracker = tastypy.Tracker(
+			TEST_PATH, mode='w', clone=False, journal=True)
+		my_tracker.mark_not_done('a')
+		my_tracker.mark_done('b')
+		my_tracker.increment_tries('c')
+		my_tracker.abort('c')
+		my_tracker.sync()
+
+		my_tracker = tastypy.Tracker(
+			TEST_PATH, mode='w', clone=False, journal=True)
+		self.assertEqual(my_tracker.num_done(), 1)
+		self.assertTrue(my_tracker.done('b'))
+		self.assertEqual(my_tracker.num_tried(), 1)
+		self.assertEqual(my_tracker.num_aborted(), 1)
+
+
+	def test_load_workers(self):
+		"""
+		Test that counters are correct when files are loaded in parallel.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_tracker = tastypy.Tracker(TEST_PATH, mode='w', clone=False)
+		my_tracker.hold()
+		for i in range(2 * tastypy.DEFAULT_FILE_SIZE):
+			my_tracker.add(i)
+			if i % 2:
+				my_tracker.mark_done(i)
+			if i % 4 == 0:
+				my_tracker.increment_tries(i)
+		my_tracker.sync()
+
+		my_tracker = tastypy.Tracker(
+			TEST_PATH, mode='w', clone=False, load_workers=2)
+		self.assertEqual(my_tracker.num_done(), tastypy.DEFAULT_FILE_SIZE)
+		self.assertEqual(
+			my_tracker.num_tried(), tastypy.DEFAULT_FILE_SIZE / 2)
+
+
+	def test_bulk_load(self):
+		"""
+		Test that ``bulk_load()`` updates default values like ``update()``,
+		and that counts are correct.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_tracker = tastypy.Tracker.bulk_load(TEST_PATH, [
+			('a', {}), ('b', {'_done': True}), ('a', {'_tries': 2}),
+			('a', {'val': 1})
+		], clone=False)
+		self.assertEqual(my_tracker.items(), [
+			('a', dict(DEFAULT_TRACKER_ITEM, _tries=2, val=1)),
+			('b', dict(DEFAULT_TRACKER_ITEM, _done=True))
+		])
+		self.assertEqual(my_tracker.num_done(), 1)
+		self.assertEqual(my_tracker.num_tried(), 1)
+
+
+	def test_delete(self):
+		"""
+		Test that deleting keys updates the counts of done and tried keys.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_tracker = tastypy.Tracker(TEST_PATH, mode='w', clone=False)
+		my_tracker.add_many(['a', 'b', 'c'])
+		my_tracker.mark_done('a')
+		my_tracker.increment_tries('b')
+		del my_tracker['a']
+		my_tracker.pop('b')
+		self.assertEqual(my_tracker.num_done(), 0)
+		self.assertEqual(my_tracker.num_tried(), 0)
+		self.assertEqual(list(my_tracker.todo_keys()), ['c'])
+		my_tracker.sync()
+		self.assertEqual(
+			tastypy.Tracker(TEST_PATH, mode='r', clone=False).keys(), ['c'])
+
+
+	def test_refresh(self):
+		"""
+		Test that a tracker opened in 'r' mode follows the changes written by
+		another tracker, reading only the files that changed, and keeps its
+		counts up to date.
+		"""
+		remove_if_exists(TEST_PATH)
+		writer = tastypy.Tracker(TEST_PATH, mode='w', clone=False, file_size=2)
+		writer.add_many(['a', 'b', 'c'])
+		writer.sync()
+		reader = tastypy.Tracker(TEST_PATH, mode='r', clone=False, file_size=2)
+		self.assertEqual(reader.refresh(), 0)
+		with self.assertRaises(ValueError):
+			writer.refresh()
+
+		# Only the files holding changes are read again
+		writer.mark_done('c')
+		writer.add_many(['d', 'e'])
+		writer.increment_tries('a')
+		writer.sync()
+		self.assertEqual(reader.refresh(), 3)
+		self.assertEqual(reader.num_done(), 1)
+		self.assertEqual(reader.num_tried(), 1)
+		self.assertEqual(reader.keys(), ['a', 'b', 'c', 'd', 'e'])
+
+		# Deleted keys are removed, and their counts undone
+		del writer['c']
+		writer.sync()
+		self.assertEqual(reader.refresh(), 2)
+		self.assertEqual(reader.num_done(), 0)
+		self.assertEqual(list(reader.todo_keys()), ['a', 'b', 'd', 'e'])
+
+		# Compaction rearranges the files, so everything is read again
+		writer.compact()
+		writer['f'] = {'_done': True, '_tries': 1, '_aborted': False}
+		writer.sync()
+		reader.refresh()
+		self.assertEqual(reader.items(), writer.items())
+		self.assertEqual(reader.num_done(), 1)
+		self.assertEqual(reader.num_tried(), 2)
+
+		# New journal entries are replayed
+		writer = tastypy.Tracker(
+			TEST_PATH, mode='w', clone=False, file_size=2, journal=True)
+		writer.mark_done('a')
+		writer.sync()
+		self.assertEqual(reader.refresh(), 0)
+		self.assertEqual(reader.num_done(), 2)
+		writer.mark_done('b')
+		writer.add('g')
+		writer.sync()
+
+		# Only the part of the journal appended since the last refresh is read
+		journal_path = os.path.join(TEST_PATH, tastypy.JOURNAL_FNAME)
+		journal_size = os.path.getsize(journal_path)
+		replayed = []
+		replay_journal = reader._replay_journal
+		def record_replay(offset, data):
+			replayed.append((offset, len(data)))
+			replay_journal(offset, data)
+		reader._replay_journal = record_replay
+		reader.refresh()
+		self.assertEqual(replayed[-1][0] + replayed[-1][1], journal_size)
+		self.assertTrue(replayed[-1][0] > 0)
+		del reader._replay_journal
+		writer.checkpoint()
+		reader.refresh()
+		self.assertEqual(reader.items(), writer.items())
+		self.assertEqual(reader.num_done(), 3)
+
+		# Keys deleted and added again move to the end, even within a file
+		for journal in [False, True]:
+			remove_if_exists(TEST_PATH)
+			writer = tastypy.Tracker(
+				TEST_PATH, mode='w', clone=False, file_size=10, journal=journal)
+			writer.add_many(['a', 'b'])
+			writer.checkpoint()
+			reader = tastypy.Tracker(
+				TEST_PATH, mode='r', clone=False, file_size=10)
+			del writer['a']
+			writer.add('c')
+			writer.add('a')
+			writer.checkpoint()
+			reader.refresh()
+			self.assertEqual(reader.keys(), ['b', 'c', 'a'])
+
+		# Journaled keys that were deleted are removed even if no files are
+		# left to read
+		remove_if_exists(TEST_PATH)
+		writer = tastypy.Tracker(
+			TEST_PATH, mode='w', clone=False, file_size=10, journal=True)
+		writer.add('a')
+		writer.mark_done('a')
+		writer.sync()
+		reader = tastypy.Tracker(TEST_PATH, mode='r', clone=False, file_size=10)
+		self.assertEqual(reader.keys(), ['a'])
+		del writer['a']
+		writer.compact()
+		reader.refresh()
+		self.assertEqual(reader.items(), [])
+		self.assertEqual(reader.num_done(), 0)
+
+
+	def test_queries_not_dirty(self):
+		"""
+		Test that querying the state of keys doesn't mark them dirty, nor does
+		marking keys with a state they already have.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_tracker = tastypy.Tracker(TEST_PATH, mode='w', clone=False)
+		my_tracker.add_many(['a', 'b', 'c'])
+		my_tracker.mark_done('a')
+		my_tracker.abort('b')
+		my_tracker.sync()
+
+		self.assertTrue(my_tracker.done('a'))
+		self.assertFalse(my_tracker.done('missing'))
+		self.assertTrue(my_tracker.aborted('b'))
+		self.assertEqual(my_tracker.tries('c'), 0)
+		self.assertEqual(list(my_tracker.todo_keys()), ['c'])
+		my_tracker.mark_done('a')
+		my_tracker.abort('b')
+		self.assertEqual(my_tracker.dirty(), set())
+
+		my_tracker.mark_done('c')
+		self.assertEqual(my_tracker.dirty(), {'c'})
+		my_tracker.sync()
+
+
+	def test_lazy(self):
+		"""
+		Test that counters are correct in lazy mode.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_tracker = tastypy.Tracker(TEST_PATH, mode='w', clone=False)
+		my_tracker.add_many(['a', 'b', 'c'])
+		my_tracker.mark_done('a')
+		my_tracker.increment_tries('b')
+		my_tracker.sync()
+
+		my_tracker = tastypy.Tracker(
+			TEST_PATH, mode='w', clone=False, lazy=True
+		)
+		self.assertEqual(len(my_tracker._values), 0)
+		self.assertEqual(my_tracker.num_done(), 1)
+		self.assertEqual(my_tracker.num_tried(), 1)
+		self.assertEqual(list(my_tracker.todo_keys()), ['b', 'c'])
+		my_tracker.sync()
+
+		# Marking a key done looks its value up twice, but that only counts
+		# as the miss that loaded its file
+		my_tracker = tastypy.Tracker(
+			TEST_PATH, mode='w', clone=False, lazy=True
+		)
+		my_tracker.mark_done('c')
+		self.assertEqual(my_tracker.cache_stats()['misses'], 1)
+		self.assertEqual(my_tracker.cache_stats()['hits'], 0)
+		my_tracker.sync()
+
+
+	def test_lazy_update(self):
+		"""
+		Test that in lazy mode, values changed by ``update()`` are kept when
+		later keys in the same update load other files.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_tracker = tastypy.Tracker(
+			TEST_PATH, mode='w', clone=False, file_size=10
+		)
+		my_tracker.add_many(['k%d' % i for i in range(30)])
+		my_tracker.sync()
+
+		my_tracker = tastypy.Tracker(
+			TEST_PATH, mode='w', clone=False, file_size=10, lazy=True,
+			max_resident_files=1
+		)
+		done_keys = ['k0', 'k15', 'k25']
+		my_tracker.update((key, {'_done': True}) for key in done_keys)
+		self.assertEqual(
+			[key for key in done_keys if my_tracker.done(key)], done_keys)
+		my_tracker.sync()
+
+		new_tracker = tastypy.Tracker(TEST_PATH, mode='r', file_size=10)
+		self.assertEqual(new_tracker.num_done(), 3)
+		self.assertEqual(
+			[key for key in new_tracker if new_tracker.done(key)], done_keys)
+
+
+	def test_lazy_walk(self):
+		"""
+		Test that working through a lazy tracker holds the values of at most
+		``max_resident_files`` files.
+		"""
+		remove_if_exists(TEST_PATH)
+		my_tracker = tastypy.Tracker(
+			TEST_PATH, mode='w', clone=False, file_size=10
+		)
+		my_tracker.add_many(str(i) for i in range(100))
+		my_tracker.sync()
+
+		my_tracker = tastypy.Tracker(
+			TEST_PATH, mode='w', clone=False, file_size=10, lazy=True,
+			max_resident_files=2
+		)
+		num_held = []
+		for key in my_tracker.todo_keys():
+			my_tracker.mark_done(key)
+			num_held.append(dict.__len__(my_tracker._values))
+		self.assertEqual(max(num_held), 20)
+		self.assertEqual(my_tracker.num_done(), 100)
+		my_tracker.sync()
+
+
+
+class TestPartitionedPOD(TestCase):
+
+	def test_partitions(self):
+		"""
+		Test that keys are spread over partitions by hash, kept in each
+		partition's order, and that partitions must be opened in order.
+		"""
+		paths = [TEST_PATH + '-%d' % i for i in range(3)]
+		for path in paths:
+			remove_if_exists(path)
+		my_pod = tastypy.PartitionedPOD(
+			paths, 'w', clone=False, file_size=5)
+		self.assertEqual(my_pod.update((str(i), i) for i in range(30)), (30, 0))
+		my_pod[('a', 1)] = {'list': []}
+		my_pod.set[('a', 1)]['list'].append(2)
+		del my_pod['0']
+		my_pod.sync()
+		self.assertEqual(len(my_pod), 30)
+		for partition in my_pod.partitions:
+			self.assertTrue(0 < len(partition) < 30)
+			keys = [key for key in partition if key != ('a', 1)]
+			self.assertEqual(keys, sorted(keys, key=int))
+
+		new_pod = tastypy.PartitionedPOD(paths, 'r', clone=False)
+		self.assertEqual(new_pod.items(), my_pod.items())
+		self.assertEqual(new_pod[('a', 1)], {'list': [2]})
+		self.assertFalse('0' in new_pod)
+		with self.assertRaises(ValueError):
+			tastypy.PartitionedPOD(
+				list(reversed(paths)), 'r', clone=False)
+		with self.assertRaises(ValueError):
+			tastypy.PartitionedPOD(paths[:2], 'r', clone=False)
+		remove_if_exists(TEST_PATH)
+		tastypy.POD(TEST_PATH, 'w', clone=False, init={'a': 1}).sync()
+		with self.assertRaises(ValueError):
+			tastypy.PartitionedPOD([TEST_PATH] + paths[1:], 'r', clone=False)
+		for path in paths:
+			remove_if_exists(path)
+
+
+	def test_close(self):
+		"""
+		Test that closing flushes and closes the partitions and stops the
+		threads, and that the default mode is only warned about once.
+		"""
+		paths = [TEST_PATH + '-%d' % i for i in range(3)]
+		for path in paths:
+			remove_if_exists(path)
+		stdout, sys.stdout = sys.stdout, StringIO()
+		try:
+			my_pod = tastypy.PartitionedPOD(paths, clone=False)
+			warnings = sys.stdout.getvalue()
+		finally:
+			sys.stdout = stdout
+		self.assertEqual(warnings.count('mode flag'), 1)
+
+		pool = my_pod._pool
+		with my_pod:
+			my_pod.update((str(i), i) for i in range(30))
+		self.assertFalse(any(thread.is_alive() for thread in pool._pool))
+		self.assertTrue(all(
+			partition._sync_state['closed']
+			for partition in my_pod.partitions
+		))
+		my_pod.close()
+		new_pod = tastypy.PartitionedPOD(paths, 'r', clone=False)
+		self.assertEqual(len(new_pod), 30)
+		new_pod.close()
+		for path in paths:
+			remove_if_exists(path)
+
 
 class TestSharedPOD(TestCase):
 
@@ -745,6 +2136,29 @@ class TestSharedTracker(TestCase):
 		tracker.close()
 
 
+	def test_sqlite_storage(self):
+		"""
+		Test that a shared tracker can keep its data in SQLite.
+		"""
+		remove_if_exists(TEST_PATH)
+		tracker = tastypy.SharedProgressTracker(
+			TEST_PATH, storage=tastypy.SQLiteStorage)
+		tracker.add('yo')
+		p1 = multiprocessing.Process(
+				target=self.concurrent_write, args=(tracker,'A'))
+		p1.start()
+		p1.join()
+		tracker.mark_done('yo')
+		tracker.add('next')
+		tracker.close()
+
+		new_tracker = tastypy.Tracker(
+			TEST_PATH, mode='r', clone=False, storage=tastypy.SQLiteStorage)
+		self.assertEqual(new_tracker.keys(), ['yo', 'next'])
+		self.assertEqual(new_tracker.tries('yo'), 200)
+		self.assertEqual(new_tracker.num_done(), 1)
+
+
 	def test_hold(self):
 		remove_if_exists(TEST_PATH)
 		tracker = tastypy.SharedProgressTracker(TEST_PATH)